@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+from errors import WorkflowError
+from json_stream import JsonArrayStream
+from workflow import stream_file
+
+DOCUMENT = {
+    'version': 12345,
+    'meta': {'links': [1, 2], 'blocks': None},
+    'blocks': [
+        {'guid': 'a', 'number': -12.5e-3, 'big': 1234567890123, 'flags': [True, False, None]},
+        {'guid': 'b', 'text': 'quote " backslash \\ slash / tab \t newline \n', 'unicode': 'é ∑ 😀'},
+        {'guid': 'c', 'nested': {'list': [[], {}, [1, [2, [3]]]], 'empty': ''}},
+    ],
+    'skipped': ['x', {'y': [1, 2, 3]}],
+    'links': [{'guid': 'l', 'src': {'port': 'p'}, 'dst': {'port': 'q'}}],
+    'last': 0.5,
+}
+
+
+def _items(text: str, chunk_size: int, keys: set[str] = frozenset({'blocks', 'links'})) -> tuple[list, set[str]]:
+    stream = JsonArrayStream(io.StringIO(text), chunk_size)
+    return list(stream.items(keys)), stream.keys
+
+
+def _expected(document: dict, keys: set[str] = frozenset({'blocks', 'links'})) -> list:
+    return [(key, item) for key, value in document.items() if key in keys for item in value]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_every_chunk_boundary(indent: int | None, ensure_ascii: bool):
+    text = json.dumps(DOCUMENT, indent=indent, ensure_ascii=ensure_ascii)
+    expected = _expected(DOCUMENT)
+
+    for chunk_size in [*range(1, 40), len(text) - 1, len(text), 1 << 16]:
+        assert _items(text, chunk_size) == (expected, set(DOCUMENT)), chunk_size
+
+
+@pytest.mark.parametrize('value', [0, -1, 1.5, -0.25e-10, 1e100, 12345678901234567890, 'x', '', '\\"', 'é',
+                                   '😀', True, False, None])
+def test_scalars_split_across_chunks(value: object):
+    # A number which stops at the end of a chunk may go on in the next one.
+    for text in (json.dumps({'blocks': [value, value]}), json.dumps({'blocks': [value]}, separators=(',', ':'))):
+        expected = _expected(json.loads(text))
+        for chunk_size in range(1, len(text) + 1):
+            assert _items(text, chunk_size)[0] == expected, (text, chunk_size)
+
+
+def test_escapes_split_across_chunks():
+    text = r'{"blocks": ["\"", "\\", "é", "😀", "\n\t\/"]}'
+    expected = _expected(json.loads(text))
+
+    for chunk_size in range(1, len(text) + 1):
+        assert _items(text, chunk_size)[0] == expected, chunk_size
+
+
+def test_only_requested_arrays_are_yielded():
+    text = json.dumps(DOCUMENT)
+
+    assert _items(text, 7, {'links'}) == (_expected(DOCUMENT, {'links'}), set(DOCUMENT))
+    assert _items(text, 7, {'skipped'}) == (_expected(DOCUMENT, {'skipped'}), set(DOCUMENT))
+
+
+@pytest.mark.parametrize('text, keys', [
+    ('{}', set()),
+    (' \n{ } ', set()),
+    ('{"links": []}', {'links'}),
+    ('{"blocks": [], "links": []}', {'blocks', 'links'}),
+    ('{"blocks": {"not": "an array"}}', {'blocks'}),
+])
+def test_missing_and_empty_arrays(text: str, keys: set[str]):
+    for chunk_size in (1, 3, 1 << 16):
+        assert _items(text, chunk_size) == ([], keys)
+
+
+@pytest.mark.parametrize('text', ['', '[]', '{"blocks": [1,]}', '{"blocks": [1 2]}', '{"blocks": [1', '{"a" 1}',
+                                  '{"blocks": ["unterminated]}'])
+def test_malformed_documents(text: str):
+    for chunk_size in (1, 4, 1 << 16):
+        with pytest.raises(json.JSONDecodeError):
+            _items(text, chunk_size)
+
+
+def test_workflow_without_blocks(tmp_path):
+    path = tmp_path / 'workflow.json'
+    path.write_text(json.dumps({'links': [], 'meta': {'blocks': []}}))
+
+    with pytest.raises(WorkflowError, match='wrong format'):
+        stream_file(str(path))
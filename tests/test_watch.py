@@ -0,0 +1,143 @@
+import copy
+import json
+import random
+
+import pytest
+
+from watch import IncrementalParser
+from workflow import Workflow
+
+
+def _port(rng: random.Random, kind: str, name: str) -> dict:
+    return {'type': kind, 'guid': _guid(rng), 'name': name, 'parameter': False}
+
+
+def _guid(rng: random.Random) -> str:
+    return f'{rng.getrandbits(64):016x}'
+
+
+def _block(rng: random.Random, number: int, parent: str | None) -> dict:
+    return {'guid': _guid(rng), 'type': 'BLOCK', 'name': f'block {number}', 'parent': parent,
+            'ui': {'position': {'x': number, 'y': number}}, 'description': None, 'description_default': None,
+            'protoblock': {'id': f'pb{number % 3}', 'version': 1},
+            'ports': [_port(rng, 'INPUT', 'in'), _port(rng, 'OUTPUT', 'out')]}
+
+
+def _link(rng: random.Random, src: dict, dst: dict) -> dict:
+    return {'guid': _guid(rng), 'src': {'port': src['ports'][1]['guid']}, 'dst': {'port': dst['ports'][0]['guid']}}
+
+
+def _generate(rng: random.Random, count: int = 30) -> dict:
+    blocks = []
+    composites = [None]
+    for number in range(count):
+        block = _block(rng, number, rng.choice(composites))
+        if rng.random() < 0.2:
+            block['type'] = 'COMPOSITE'
+            composites.append(block['guid'])
+        blocks.append(block)
+    # Few sources, so ports have several links and their order matters.
+    links = [_link(rng, rng.choice(blocks[:3]), rng.choice(blocks)) for _ in range(count)]
+
+    return {'version': 1, 'blocks': blocks, 'links': links}
+
+
+def _edit(rng: random.Random, data: dict, step: int):
+    blocks, links = data['blocks'], data['links']
+    kind = rng.choice(['rename', 'delete block', 'insert block', 'append block', 'move block',
+                       'delete link', 'insert link', 'append link', 'prepend link', 'edit link'])
+    number = rng.randrange(len(blocks))
+
+    if kind == 'rename':
+        blocks[number]['name'] = f'renamed {step}'
+    elif kind == 'delete block' and len(blocks) > 5:
+        removed = blocks.pop(number)
+        for block in blocks:
+            if block['parent'] == removed['guid']:
+                block['parent'] = None
+    elif kind == 'insert block':
+        blocks.insert(number, _block(rng, 1000 + step, rng.choice([None, blocks[number]['parent']])))
+    elif kind == 'append block':
+        blocks.append(_block(rng, 1000 + step, None))
+    elif kind == 'move block':
+        block = blocks[number]
+        block['parent'] = next((other['guid'] for other in blocks if other['type'] == 'COMPOSITE'
+                                and other['guid'] != block['guid'] and other['parent'] is None), None)
+    elif kind == 'delete link' and links:
+        del links[rng.randrange(len(links))]
+    elif kind in ('insert link', 'append link', 'prepend link'):
+        link = _link(rng, rng.choice(blocks[:3]), rng.choice(blocks))
+        position = {'insert link': rng.randrange(len(links) + 1), 'append link': len(links), 'prepend link': 0}[kind]
+        links.insert(position, link)
+    elif kind == 'edit link' and links:
+        links[rng.randrange(len(links))]['src']['port'] = rng.choice(blocks[:3])['ports'][1]['guid']
+
+
+def _assert_same(workflow: Workflow, full: Workflow):
+    assert [block.guid for block in workflow.blocks] == [block.guid for block in full.blocks]
+    assert [link.guid for link in workflow.links] == [link.guid for link in full.links]
+    for link in full.links:
+        assert workflow.links.from_port(link.src) == full.links.from_port(link.src)
+        assert workflow.links.to_port(link.dst) == full.links.to_port(link.dst)
+
+    index, full_index = workflow.index, full.index
+    assert index.order == full_index.order
+    assert index.ports.keys() == full_index.ports.keys()
+    assert {parent: [block.guid for block in children] for parent, children in index.children.items()} == \
+        {parent: [block.guid for block in children] for parent, children in full_index.children.items()}
+    assert index.content_hashes == full_index.content_hashes
+    assert index.subtree_hashes == full_index.subtree_hashes
+    assert [index.get_path(block) for block in workflow.blocks] == [full_index.get_path(block) for block in full.blocks]
+
+
+def test_links_inserted_before_kept_ones_follow_the_file_order():
+    rng = random.Random(0)
+    data = _generate(rng)
+    source = data['blocks'][0]
+    data['links'] = [_link(rng, source, data['blocks'][1]), _link(rng, source, data['blocks'][2])]
+    parser = IncrementalParser()
+    parser.parse(json.dumps(data, indent=2))
+
+    data['links'].insert(0, _link(rng, source, data['blocks'][3]))
+    text = json.dumps(data, indent=2)
+    workflow, _ = parser.parse(text)
+
+    port = source['ports'][1]['guid']
+    assert [link.guid for link in workflow.links.from_port(port)] == [link['guid'] for link in data['links']]
+    _assert_same(workflow, Workflow.from_dict(json.loads(text)))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_incremental_parse_matches_full_parse(seed: int):
+    rng = random.Random(seed)
+    data = _generate(rng)
+    parser = IncrementalParser()
+    parser.parse(json.dumps(data, indent=2))
+
+    for step in range(30):
+        _edit(rng, data, step)
+        text = json.dumps(data, indent=2)
+        workflow, _ = parser.parse(text)
+        _assert_same(workflow, Workflow.from_dict(json.loads(text)))
+
+
+def test_unchanged_text_keeps_the_workflow():
+    data = _generate(random.Random(1))
+    text = json.dumps(data)
+    parser = IncrementalParser()
+    workflow, _ = parser.parse(text)
+
+    assert parser.parse(text) == (workflow, 0)
+
+
+def test_edit_out_of_arrays_is_parsed_in_full():
+    data = _generate(random.Random(2))
+    parser = IncrementalParser()
+    parser.parse(json.dumps(data))
+
+    changed = copy.deepcopy(data)
+    changed['version'] = 2
+    workflow, count = parser.parse(json.dumps(changed))
+
+    assert count == len(data['blocks']) + len(data['links'])
+    _assert_same(workflow, Workflow.from_dict(changed))
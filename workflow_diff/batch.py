@@ -0,0 +1,176 @@
+import argparse
+import os.path
+import re
+import shlex
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from context import protoblocks, get_workflow_path, get_protoblocks_path, add_comparer_args, add_loader_args
+from diffs import RENDERERS
+from errors import WorkflowError
+from loader import load_workflow, paused_gc
+from main import diff_workflows, set_logger
+from registry import get_comparers
+from snapshot import create_snapshots
+from sources import files_are_identical, get_input_path
+
+logger = logging.getLogger(f'log.{__name__}')
+
+EXTENSIONS = {'text': 'txt', 'jsonl': 'jsonl'}
+
+
+@dataclass(slots=True, frozen=True)
+class BatchOptions:
+    """Options shared by all workers of a batch."""
+
+    output_dir: str
+    output_format: str
+    streaming: bool
+    use_cache: bool
+    cache_limit: int
+    similarity: bool
+    scope: str | None
+    only: list[str] | None
+    skip: list[str]
+
+
+def read_manifest(path: str) -> list[tuple[str, str]]:
+    """Reads pairs of paths from the manifest: one pair per line, '#' starts a comment, spaces may be quoted."""
+
+    pairs = []
+    with open(path, 'r', encoding='utf-8') as fh:
+        for line_number, line in enumerate(fh, start=1):
+            paths = shlex.split(line, comments=True)
+            if not paths:
+                continue
+            if len(paths) != 2:
+                logger.error(f'{path}:{line_number}: a line must consist of two paths.')
+                exit(-1)
+            pairs.append((paths[0], paths[1]))
+
+    return pairs
+
+
+def get_chain_pairs(paths: list[str]) -> list[tuple[str, str]]:
+    """Returns pairs of neighbouring revisions."""
+
+    return list(zip(paths, paths[1:]))
+
+
+def split_into_chunks(pairs: list, number_of_chunks: int) -> list[list]:
+    """Splits the pairs into contiguous chunks, so neighbouring pairs of a worker can share parsed workflows."""
+
+    size, rest = divmod(len(pairs), number_of_chunks)
+    chunks = []
+    start = 0
+    for number in range(number_of_chunks):
+        end = start + size + (1 if number < rest else 0)
+        if end > start:
+            chunks.append(pairs[start:end])
+        start = end
+
+    return chunks
+
+
+def get_report_path(options: BatchOptions, number: int, old_path: str, new_path: str) -> str:
+    """Returns a path of the report about the pair."""
+
+    names = [re.sub(r'[^\w.-]+', '_', os.path.basename(os.path.normpath(path))) for path in (old_path, new_path)]
+    return os.path.join(options.output_dir, f'{number:04d}-{names[0]}-{names[1]}.{EXTENSIONS[options.output_format]}')
+
+
+def diff_chunk(chunk: list[tuple[int, str, str]], options: BatchOptions) -> list[str]:
+    """Diffs the pairs of the chunk one after another and writes a report per pair.
+
+    Workflows parsed for a pair are reused by the next pair of the chunk, their memoized paths are forgotten
+    if the protoblocks directories change.
+    """
+
+    comparers = get_comparers(options.only, options.skip)
+    snapshots = create_snapshots(options.use_cache, options.cache_limit)
+    loaded = {}
+    reports = []
+
+    for number, old_path, new_path in chunk:
+        paths = [get_input_path(old_path), get_input_path(new_path)]
+        workflow_paths = [get_workflow_path(path) for path in paths]
+        directories = protoblocks.directories
+        protoblocks.configure([get_protoblocks_path(path) for path in workflow_paths], use_cache=options.use_cache)
+        if protoblocks.directories != directories:
+            # Paths memoized by the reused Workflows have titles from the manifests of the previous pair.
+            for workflow in loaded.values():
+                workflow.index.clear_paths()
+
+        report_path = get_report_path(options, number, old_path, new_path)
+        with open(report_path, 'w', encoding='utf-8') as fh:
+            renderer = RENDERERS[options.output_format](fh)
+
+            if files_are_identical(*workflow_paths):
+                renderer.close()
+            else:
+                with paused_gc():
+                    loaded = {path: loaded.get(path) or load_workflow(path, options.streaming, snapshots, options.scope)
+                              for path in workflow_paths}
+                diff_workflows(loaded[workflow_paths[0]], loaded[workflow_paths[1]], renderer, comparers,
+                               similarity=options.similarity)
+
+        logger.info(f'{old_path} -> {new_path}: {report_path}')
+        reports.append(report_path)
+
+    return reports
+
+
+def run_batch(pairs: list[tuple[str, str]], options: BatchOptions, jobs: int = 1) -> list[str]:
+    """Diffs all the pairs by a pool of jobs processes and returns paths of the reports in the order of the pairs."""
+
+    os.makedirs(options.output_dir, exist_ok=True)
+    numbered = [(number, old_path, new_path) for number, (old_path, new_path) in enumerate(pairs, start=1)]
+
+    if jobs <= 1:
+        return diff_chunk(numbered, options)
+
+    reports = []
+    chunks = split_into_chunks(numbered, jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk_reports in executor.map(diff_chunk, chunks, [options] * len(chunks)):
+            reports += chunk_reports
+
+    return reports
+
+
+def get_args():
+    """Getting arguments from the console."""
+    parser = argparse.ArgumentParser(description='Diff many pairs of workflows and write a report per pair.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-m', '--manifest', type=str, help='File with two paths per line')
+    source.add_argument('-c', '--chain', type=str, nargs='+', help='Revisions to diff one after another')
+    parser.add_argument('-o', '--output', type=str, help='Directory for the reports', default='reports')
+    parser.add_argument("-j", "--jobs", help="Number of worker processes", type=int, default=os.cpu_count())
+    parser.add_argument("-f", "--format", help="Output format of the reports",
+                        choices=['text', 'jsonl'], default='text')
+    add_loader_args(parser)
+    add_comparer_args(parser)
+
+    return parser.parse_args()
+
+
+def controller():
+    set_logger()
+    args = get_args()
+    pairs = read_manifest(args.manifest) if args.manifest is not None else get_chain_pairs(args.chain)
+    options = BatchOptions(output_dir=os.path.abspath(args.output), output_format=args.format,
+                           streaming=args.stream, use_cache=not args.no_cache,
+                           cache_limit=args.cache_limit, similarity=args.similarity,
+                           scope=args.scope, only=args.only, skip=args.skip)
+
+    try:
+        reports = run_batch(pairs, options, jobs=min(args.jobs, len(pairs)))
+    except WorkflowError as ex:
+        logger.error(ex)
+        exit(-1)
+    print(f'{len(reports)} reports have been written to {options.output_dir}')
+
+
+if __name__ == '__main__':
+    controller()
@@ -0,0 +1,175 @@
+import argparse
+import io
+import json
+import platform
+import tempfile
+import tracemalloc
+import logging
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from blocks import Protoblock
+from context import protoblocks, get_workflow_path, get_protoblocks_path
+from diffs import TextRenderer, render
+from errors import WorkflowError
+from generator import add_generator_args, get_generator_options, generate_pair
+from loader import paused_gc
+from matching import match_workflows
+from profiling import Profiler
+from registry import get_comparers
+from sources import get_input_path
+from workflow import Workflow
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+def run_pipeline(old_path: str, new_path: str, recorder: Profiler, streaming: bool = False):
+    """Diffs two projects stage by stage as main.py does, without the on-disk caches."""
+
+    comparers = get_comparers()
+
+    with recorder.stage('load'), paused_gc():
+        old_workflow = Workflow.from_file(get_workflow_path(old_path), streaming=streaming)
+        new_workflow = Workflow.from_file(get_workflow_path(new_path), streaming=streaming)
+
+    with recorder.stage('protoblocks'):
+        protoblocks.configure([get_protoblocks_path(get_workflow_path(path)) for path in (old_path, new_path)],
+                              use_cache=False)
+        # Every repeat reads the manifests again, as a fresh process of main.py does.
+        protoblocks.clear()
+        for workflow in (old_workflow, new_workflow):
+            for block in workflow.blocks:
+                if isinstance(block, Protoblock):
+                    block.protoblock_name
+
+    with recorder.stage('index'):
+        for workflow in (old_workflow, new_workflow):
+            workflow.index.subtree_hashes
+
+    with recorder.stage('matching'):
+        matching = match_workflows(old_workflow, new_workflow)
+
+    diffs = []
+    for comparer in comparers:
+        with recorder.stage(f'comparer:{comparer.name}'):
+            diffs += comparer.compare(old_workflow, new_workflow, matching)
+
+    with recorder.stage('render'):
+        render(diffs, TextRenderer(io.StringIO()))
+
+    return len(old_workflow.blocks), len(new_workflow.blocks), len(diffs)
+
+
+def run_benchmark(old_path: str, new_path: str, repeat: int = 3, trace_memory: bool = True,
+                  streaming: bool = False) -> dict:
+    """Runs the pipeline repeat times and returns the best time of every stage.
+
+    Memory peaks are taken from one more run with traced memory, because tracing slows the code down.
+    """
+
+    runs = []
+    for _ in range(repeat):
+        recorder = Profiler()
+        recorder.enable()
+        counts = run_pipeline(old_path, new_path, recorder, streaming)
+        runs.append(recorder.stats)
+
+    stages = {name: {'seconds': min(run[name].seconds for run in runs)} for name in runs[0]}
+
+    if trace_memory:
+        recorder = Profiler()
+        recorder.enable()
+        tracemalloc.start()
+        try:
+            run_pipeline(old_path, new_path, recorder, streaming)
+        finally:
+            tracemalloc.stop()
+        for name, stats in recorder.stats.items():
+            stages[name]['peak_bytes'] = stats.peak
+
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'old_blocks': counts[0],
+        'new_blocks': counts[1],
+        'diffs': counts[2],
+        'repeat': repeat,
+        'streaming': streaming,
+        'stages': stages,
+        'total_seconds': sum(stage['seconds'] for stage in stages.values()),
+    }
+
+
+def format_results(results: dict, baseline: dict | None = None) -> str:
+    """Returns a table of the stages. With a baseline the times are compared with it."""
+
+    header = f'{"Stage":<28}{"Time, s":>10}{"Peak, MiB":>12}'
+    if baseline is not None:
+        header += f'{"Baseline, s":>14}{"Change":>10}'
+    lines = [header, '-' * len(header)]
+
+    rows = list(results['stages'].items()) + [('total', {'seconds': results['total_seconds']})]
+    for name, stage in rows:
+        peak = stage.get('peak_bytes')
+        peak_text = f'{peak / 2 ** 20:.1f}' if peak is not None else ''
+        line = f'{name:<28}{stage["seconds"]:>10.3f}{peak_text:>12}'
+        if baseline is not None:
+            old = baseline['total_seconds'] if name == 'total' else baseline['stages'].get(name, {}).get('seconds')
+            if old:
+                line += f'{old:>14.3f}{(stage["seconds"] - old) / old:>+10.1%}'
+        lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def get_args():
+    """Getting arguments from the console."""
+    parser = argparse.ArgumentParser(description='Time every stage of a diff of two workflows and write the results.')
+    parser.add_argument('--pair', type=str, nargs=2, metavar=('OLD', 'NEW'),
+                        help='Projects to diff. A synthetic pair is generated if it is not specified')
+    parser.add_argument('--workdir', type=str, help='Directory for the synthetic pair. A temporary one by default')
+    add_generator_args(parser)
+    parser.add_argument('-r', '--repeat', help='Number of timed runs, the best time is taken', type=int, default=3)
+    parser.add_argument('-s', '--stream', help='Parse workflow.json item by item', action='store_true')
+    parser.add_argument('--no-memory', help='Do not trace memory peaks', action='store_true')
+    parser.add_argument('-o', '--output', type=str, help='File for the results in json')
+    parser.add_argument('--compare', type=str, help='Results of a previous run to compare with')
+
+    return parser.parse_args()
+
+
+def controller():
+    args = get_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.pair is not None:
+            old_path, new_path = (get_input_path(path) for path in args.pair)
+            generator_options = None
+        else:
+            generator_options = get_generator_options(args)
+            old_path, new_path = generate_pair(args.workdir or temp_dir, generator_options)
+
+        try:
+            results = run_benchmark(old_path, new_path, repeat=max(args.repeat, 1), trace_memory=not args.no_memory,
+                                    streaming=args.stream)
+        except WorkflowError as ex:
+            logger.error(ex)
+            exit(-1)
+
+    results['generator'] = asdict(generator_options) if generator_options is not None else None
+    results['pair'] = args.pair
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as fh:
+            baseline = json.load(fh)
+
+    print(format_results(results, baseline))
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    controller()
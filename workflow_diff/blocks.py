@@ -1,8 +1,16 @@
 from abc import ABC
-from dataclasses import dataclass, field
-from port import Port
+from dataclasses import dataclass, field, fields
+from typing import TYPE_CHECKING
+from port import PortSlice, PortTable, intern_optional
 from context import protoblocks
 
+if TYPE_CHECKING:
+    from index import WorkflowIndex
+
+# Equal settings are shared by all Blocks, most of them have no customized settings at all.
+_shared_settings = {}
+_field_names = {}
+
 
 @dataclass(slots=True, frozen=True)
 class BlockSettings:
@@ -37,21 +45,21 @@ class Block(ABC):
     position: tuple[int] = field(compare=False)
     description: str = field(compare=False)
     settings: BlockSettings = field(compare=False)
-    ports: tuple[Port] = field(compare=False)
+    ports: PortSlice = field(compare=False)
 
     @classmethod
-    def from_dict(cls, dictionary: dict):
-        """Creating an object of Block from the dictionary."""
+    def from_dict(cls, dictionary: dict, port_table: PortTable | None = None):
+        """Creating an object of Block from the dictionary. Ports are stored in the port_table of the workflow."""
 
-        ports = cls._get_ports(dictionary['ports'])
+        ports = cls._get_ports(dictionary['ports'], port_table)
         description = cls._get_description(dictionary['description'], dictionary['description_default'])
         settings = cls._get_settings(dictionary)
 
         return cls(
-            guid=dictionary['guid'],
-            type=dictionary['type'],
-            name=dictionary['name'],
-            parent=dictionary['parent'],
+            guid=intern_optional(dictionary['guid']),
+            type=intern_optional(dictionary['type']),
+            name=intern_optional(dictionary['name']),
+            parent=intern_optional(dictionary['parent']),
             position=tuple(dictionary['ui']['position'].values()),
             description=description,
             settings=settings,
@@ -69,51 +77,49 @@ class Block(ABC):
             memory, cpu = None, None
 
         timeout = dictionary.get('idle_timeout_user')
+        settings = BlockSettings(memory, cpu, timeout)
 
-        return BlockSettings(memory, cpu, timeout)
+        return _shared_settings.setdefault(settings, settings)
 
     @staticmethod
     def _get_description(description: dict, description_default: dict) -> str | None:
         """Returns a tuple of Ports which are included in the Block."""
 
         if description is not None:
-            return description['']
+            return intern_optional(description[''])
         elif description_default is not None:
-            return description_default['']
+            return intern_optional(description_default[''])
 
         return description
 
     @staticmethod
-    def _get_ports(ports: list[dict]) -> tuple[Port]:
-        """Returns a tuple of Ports which are included in the Block."""
+    def _get_ports(ports: list[dict], port_table: PortTable | None = None) -> PortSlice:
+        """Returns Ports which are included in the Block."""
 
-        return tuple(Port.from_dict(port) for port in ports)
+        return PortSlice.from_list(ports, port_table)
 
     def get_title(self) -> str:
         """Returns briefly block description."""
 
         return self.name
 
-    def get_path(self, workflow: list) -> str:
-        """Returns a path of Blocks parents."""
+    def get_values(self) -> tuple:
+        """Returns values of all fields of the Block."""
 
-        parent_guid = self.parent
-        list_of_parents = [self.get_title()]
+        names = _field_names.get(type(self))
+        if names is None:
+            names = _field_names[type(self)] = tuple(field.name for field in fields(self))
 
-        while parent_guid is not None:
-            for block in workflow:
-                if block.guid == parent_guid:
-                    list_of_parents.append(block.get_title())
-                    parent_guid = block.parent
+        return tuple(map(self.__getattribute__, names))
 
-                    break
+    def __reduce__(self):
+        # Pickling by the constructor is much faster than restoring the state of a frozen dataclass field by field.
+        return type(self), self.get_values()
 
-        block_path = ''
-        for parent in list(reversed(list_of_parents))[:-1]:
-            block_path += parent + ' / '
-        block_path += list_of_parents[0]
+    def get_path(self, index: 'WorkflowIndex') -> str:
+        """Returns a path of Blocks parents."""
 
-        return block_path
+        return index.get_path(self)
 
 
 @dataclass(slots=True, frozen=True)
@@ -129,49 +135,31 @@ class Protoblock(Block):
 
     protoblock_id: str = field(compare=False)
     protoblock_version: int = field(compare=False)
-    protoblock_name: str = field(compare=False)
 
     @classmethod
-    def from_dict(cls, dictionary: dict):
-        ports = cls._get_ports(dictionary['ports'])
+    def from_dict(cls, dictionary: dict, port_table: PortTable | None = None):
+        ports = cls._get_ports(dictionary['ports'], port_table)
         description = cls._get_description(dictionary['description'], dictionary['description_default'])
         settings = cls._get_settings(dictionary)
-        protoblock_id = dictionary['protoblock']['id']
-        protoblock_version = dictionary['protoblock']['version']
-
-        if protoblocks:
-            protoblock_name = cls._get_protoblock_name(protoblock_id, protoblock_version)
-        else:
-            protoblock_name = None
 
         return cls(
-            guid=dictionary['guid'],
-            type=dictionary['type'],
-            name=dictionary['name'],
-            parent=dictionary['parent'],
+            guid=intern_optional(dictionary['guid']),
+            type=intern_optional(dictionary['type']),
+            name=intern_optional(dictionary['name']),
+            parent=intern_optional(dictionary['parent']),
             position=tuple(dictionary['ui']['position'].values()),
             description=description,
             settings=settings,
             ports=ports,
-            protoblock_id=protoblock_id,
-            protoblock_version=protoblock_version,
-            protoblock_name=protoblock_name
+            protoblock_id=intern_optional(dictionary['protoblock']['id']),
+            protoblock_version=dictionary['protoblock']['version']
         )
 
-    @staticmethod
-    def _get_protoblock_name(pb_id: str, pb_version: str) -> str:
-        """Returns a name of protoblock."""
-
-        id_version = f'{pb_id}-{pb_version}'
-
-        if id_version in protoblocks[0].keys():
-            name = protoblocks[0][id_version]
-        elif id_version in protoblocks[1].keys():
-            name = protoblocks[1][id_version]
-        else:
-            name = None
+    @property
+    def protoblock_name(self) -> str | None:
+        """Returns a name of protoblock. The manifest is read on the first request."""
 
-        return name
+        return protoblocks.get(self.protoblock_id, self.protoblock_version)
 
     def get_title(self) -> str:
 
@@ -181,11 +169,11 @@ class Protoblock(Block):
             return f"{self.name}"
 
 
-def create_block(dictionary: dict) -> Block:
+def create_block(dictionary: dict, port_table: PortTable | None = None) -> Block:
     """A block factory which returns Composite of Protoblock object."""
 
     factory_dict = {
         'COMPOSITE': Composite,
         'BLOCK': Protoblock
     }
-    return factory_dict[dictionary['type']].from_dict(dictionary)
+    return factory_dict[dictionary['type']].from_dict(dictionary, port_table)
@@ -0,0 +1,71 @@
+import os
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+def get_cache_dir() -> str:
+    """Returns the directory of the on-disk caches. It can be changed by WORKFLOW_DIFF_CACHE_DIR."""
+
+    path = os.environ.get('WORKFLOW_DIFF_CACHE_DIR')
+    if path is None:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'workflow-diff')
+
+    return path
+
+
+class ManifestCache:
+    """SQLite cache of protoblock names. A name is valid while the path, mtime and size of its manifest are the same.
+
+    sqlite3 is imported by the methods, snapshots need only get_cache_dir of this module.
+    """
+
+    def __init__(self, path: str | None = None):
+        import sqlite3
+
+        if path is None:
+            path = os.path.join(get_cache_dir(), 'manifests.sqlite')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS manifests '
+                                 '(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, name TEXT)')
+
+    @classmethod
+    def open(cls, path: str | None = None):
+        """Opens the cache. Returns None if it is not possible, so the names are read without the cache."""
+
+        import sqlite3
+
+        try:
+            return cls(path)
+        except (OSError, sqlite3.Error) as ex:
+            logger.warning(f'Protoblock cache is disabled: {ex}')
+            return None
+
+    def get(self, path: str, stat: os.stat_result) -> tuple[bool, str | None]:
+        """Returns (True, name) if the manifest has not been changed since it was cached and (False, None) otherwise."""
+
+        row = self._connection.execute('SELECT mtime_ns, size, name FROM manifests WHERE path = ?',
+                                       (path,)).fetchone()
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            return False, None
+
+        return True, row[2]
+
+    def put(self, entries: list[tuple[str, os.stat_result, str | None]]):
+        """Stores names of the manifests read in this run."""
+
+        import sqlite3
+
+        try:
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?)',
+                                             [(path, stat.st_mtime_ns, stat.st_size, name)
+                                              for path, stat, name in entries])
+        except sqlite3.Error as ex:
+            logger.warning(f'Protoblock cache has not been updated: {ex}')
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,39 @@
+"""Console entry points of the installed package.
+
+Modules of the package import each other by flat names, so the directory of the package is put on sys.path first.
+The pipeline itself is imported lazily by the controllers.
+"""
+
+import os
+import sys
+
+
+def _add_package_path():
+    path = os.path.dirname(os.path.abspath(__file__))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def main():
+    _add_package_path()
+    from main import controller
+
+    controller()
+
+
+def batch():
+    _add_package_path()
+    from batch import controller
+
+    controller()
+
+
+def daemon():
+    _add_package_path()
+    from daemon import controller
+
+    controller()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,24 @@
-from diffs import Diff, DiffAdd, DiffDel
+from diffs import Diff, DiffAdd, DiffDel, DiffEditRecreate
 from workflow import Workflow
+from matching import Matching
+from registry import MATCHING, register
 import logging
 
 logger = logging.getLogger(f'log.{__name__}')
 
 
-def compare(old_workflow: Workflow, new_workflow: Workflow) -> list[Diff]:
-    """Compares two Block lists and returns a Diffs list of those compares. Finds added and deleted Blocks."""
+@register('blocks', needs=(MATCHING,), order=10, shardable=True)
+def compare(old_workflow: Workflow, new_workflow: Workflow, matching: Matching) -> list[Diff]:
+    """Compares two Block lists and returns a Diffs list of those compares. Finds added and deleted Blocks.
+
+    Blocks paired by the similarity matching are reported as recreated instead.
+    """
 
     logger.info(f'First workflow consists of {len(old_workflow.blocks)} blocks.')
     logger.info(f'Second workflow consists of {len(new_workflow.blocks)} blocks.\n')
 
-    added = set(new_workflow.blocks) - set(old_workflow.blocks)
-    deleted = set(old_workflow.blocks) - set(new_workflow.blocks)
+    added = matching.added_blocks
+    deleted = matching.deleted_blocks
 
     logger.debug(f'There are only {len(added) + len(deleted)} difference:')
 
@@ -22,6 +28,9 @@ def compare(old_workflow: Workflow, new_workflow: Workflow) -> list[Diff]:
         logger.debug(f'Second workflow consists of: {added}')
 
     for block in deleted:
-        yield DiffDel(block.get_path(old_workflow.blocks))
+        yield DiffDel(block.get_path(old_workflow.index), block.guid)
     for block in added:
-        yield DiffAdd(block.get_path(new_workflow.blocks))
+        yield DiffAdd(block.get_path(new_workflow.index), block.guid)
+    for old_block, new_block in matching.similar_blocks:
+        yield DiffEditRecreate(new_block.get_path(new_workflow.index), new_block.guid,
+                               old_block.get_path(old_workflow.index), old_block.guid)
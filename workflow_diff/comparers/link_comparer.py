@@ -1,36 +1,55 @@
 from diffs import DiffLink, DiffLinkAdd, DiffLinkDel
+from link import Link
 from workflow import Workflow
-from blocks import Block
-from port import Port
+from matching import Matching
+from registry import register
 import logging
 
 logger = logging.getLogger(f'log.{__name__}')
 
 
-def find_block_in_block_list(blocks_list: list[Block], port_guid: str) -> tuple[Block, Port]:
-    """Finds a Blocks in the workflow by his Port (port_guid)."""
+def _drop_recreated(added: list[Link], deleted: list[Link], port_aliases: dict[str, str]) \
+        -> tuple[list[Link], list[Link]]:
+    """Drops pairs of deleted and added Links which connect the same Ports once the aliases are applied."""
 
-    for block in blocks_list:
-        for port in block.ports:
-            if port.guid == port_guid:
-                return block, port
+    added_by_ports = {}
+    for link in added:
+        added_by_ports.setdefault((link.src, link.dst), []).append(link)
+
+    kept_deleted = []
+    dropped = set()
+    for link in deleted:
+        same = added_by_ports.get((port_aliases.get(link.src, link.src), port_aliases.get(link.dst, link.dst)))
+        if same:
+            dropped.add(same.pop().guid)
+        else:
+            kept_deleted.append(link)
+
+    return [link for link in added if link.guid not in dropped], kept_deleted
+
+
+@register('links', needs=(), order=30)
+def compare(old_workflow: Workflow, new_workflow: Workflow, matching: Matching) -> list[DiffLink]:
+    """Compares two Workflows and returns a Diffs list of those compares. Finds added and deleted Links.
 
+    Links which only follow Blocks recreated with a new guid are not reported.
+    """
 
-def compare(old_workflow: Workflow, new_workflow: Workflow) -> list[DiffLink]:
-    """Compares two Workflows and returns a Diffs list of those compares. Finds added and deleted Links."""
+    added = [link for link in new_workflow.links if link.guid not in old_workflow.links]
+    deleted = [link for link in old_workflow.links if link.guid not in new_workflow.links]
 
-    added = set(new_workflow.links) - set(old_workflow.links)
-    deleted = set(old_workflow.links) - set(new_workflow.links)
+    if matching.port_aliases:
+        added, deleted = _drop_recreated(added, deleted, matching.port_aliases)
 
     for link in deleted:
-        block1, port1 = find_block_in_block_list(old_workflow.blocks, link.src)
-        block2, port2 = find_block_in_block_list(old_workflow.blocks, link.dst)
+        block1, port1 = old_workflow.index.find_port(link.src)
+        block2, port2 = old_workflow.index.find_port(link.dst)
 
-        yield DiffLinkDel(block1.get_path(old_workflow.blocks), port1.get_title(),
-                          block2.get_path(old_workflow.blocks), port2.get_title())
+        yield DiffLinkDel(block1.get_path(old_workflow.index), link.guid, port1.get_title(),
+                          block2.get_path(old_workflow.index), port2.get_title(), link.src, link.dst)
     for link in added:
-        block1, port1 = find_block_in_block_list(new_workflow.blocks, link.src)
-        block2, port2 = find_block_in_block_list(new_workflow.blocks, link.dst)
+        block1, port1 = new_workflow.index.find_port(link.src)
+        block2, port2 = new_workflow.index.find_port(link.dst)
 
-        yield DiffLinkAdd(block1.get_path(new_workflow.blocks), port1.get_title(),
-                          block2.get_path(new_workflow.blocks), port2.get_title())
+        yield DiffLinkAdd(block1.get_path(new_workflow.index), link.guid, port1.get_title(),
+                          block2.get_path(new_workflow.index), port2.get_title(), link.src, link.dst)
@@ -1,24 +1,17 @@
 from diffs import DiffEditPort, DiffEditPortAdd, DiffEditPortDel
 from workflow import Workflow
-from comparers.block_difference import find_edited_objects
+from matching import Matching
+from registry import MATCHING, register
 import logging
 
 logger = logging.getLogger(f'log.{__name__}')
 
 
-def compare(old_workflow: Workflow, new_workflow: Workflow) -> list[DiffEditPort]:
+@register('ports', needs=(MATCHING,), order=40, shardable=True)
+def compare(old_workflow: Workflow, new_workflow: Workflow, matching: Matching) -> list[DiffEditPort]:
     """Compares two Block lists and returns a Diffs list of those compares. Finds added and deleted Ports."""
 
-    wl1, wl2 = find_edited_objects(old_workflow.blocks, new_workflow.blocks)
-
-    for blocks in zip(wl1, wl2):
-        block1 = blocks[0]
-        block2 = blocks[1]
-
-        added = set(block2.ports) - set(block1.ports)
-        deleted = set(block1.ports) - set(block2.ports)
-
-        for port in deleted:
-            yield DiffEditPortDel(block2.get_path(new_workflow.blocks), port.get_title())
-        for port in added:
-            yield DiffEditPortAdd(block2.get_path(new_workflow.blocks), port.get_title())
+    for block, port in matching.deleted_ports:
+        yield DiffEditPortDel(block.get_path(new_workflow.index), block.guid, port.get_title(), port.guid)
+    for block, port in matching.added_ports:
+        yield DiffEditPortAdd(block.get_path(new_workflow.index), block.guid, port.get_title(), port.guid)
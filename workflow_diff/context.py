@@ -1,87 +1,268 @@
 import argparse
 import os.path
 import logging
-import yaml
-from dataclasses import dataclass
+
+from sources import (Location, find_archive_workflow, get_git_object, get_git_type, get_input_path, get_parent,
+                     is_archive, is_directory, is_git_spec, join_location, open_text)
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from cache import ManifestCache
 
 logger = logging.getLogger(f'log.{__name__}')
-protoblocks = []
 
 
-@dataclass(slots=True)
+class ProtoblockNames:
+    """Names of protoblocks, read on demand from manifest.yaml of the protoblocks directories and memoized.
+
+    Directories are searched in order, so the name from the first workflow wins.
+    """
+
+    def __init__(self):
+        self.directories = []
+        self.use_cache = False
+        self._names = {}
+        self._cache = None
+
+    def configure(self, directories: list[Location | None], use_cache: bool = True):
+        """Sets the protoblocks directories. Names read before are forgotten only if the directories change."""
+
+        directories = [directory for directory in directories if directory is not None]
+        if directories != self.directories:
+            self._names = {}
+
+        self.directories = directories
+        self.use_cache = use_cache
+
+    def clear(self):
+        """Forgets the names read before, so changed manifests are read again."""
+
+        self._names = {}
+
+    def forget_cache(self):
+        """Forgets the connection to the on-disk cache opened before a fork, so a forked process opens its own one."""
+
+        self._cache = None
+
+    def get(self, pb_id: str, pb_version: int) -> str | None:
+        """Returns a name of the protoblock or None if there is no manifest about it."""
+
+        id_version = f'{pb_id}-{pb_version}'
+
+        if id_version not in self._names:
+            self._names[id_version] = self._read(id_version)
+
+        return self._names[id_version]
+
+    def _read(self, id_version: str) -> str | None:
+        """Finds manifest.yaml of the protoblock and returns its name, from the on-disk cache if it is unchanged.
+
+        Manifests in archives and git revisions are read directly, without the on-disk cache.
+        """
+
+        for directory in self.directories:
+            if not isinstance(directory, str):
+                try:
+                    return self._read_manifest(join_location(directory, id_version, 'manifest.yaml'))
+                except FileNotFoundError:
+                    continue
+
+            path = os.path.abspath(os.path.join(directory, id_version, 'manifest.yaml'))
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            cache = self._get_cache()
+            found, name = cache.get(path, stat) if cache is not None else (False, None)
+            if not found:
+                try:
+                    name = self._read_manifest(path)
+                except FileNotFoundError as ex:
+                    logger.warning(ex)
+                    name = None
+                if cache is not None:
+                    cache.put([(path, stat, name)])
+
+            return name
+
+        logger.debug(f'There is no manifest about protoblock {id_version}.')
+        return None
+
+    def _get_cache(self) -> 'ManifestCache | None':
+        if self.use_cache and self._cache is None:
+            from cache import ManifestCache
+
+            self._cache = ManifestCache.open()
+            self.use_cache = self._cache is not None
+
+        return self._cache
+
+    @staticmethod
+    def _read_manifest(path: Location) -> str | None:
+        """Opens manifest.yaml of the protoblock and returns its name."""
+
+        # yaml takes a long time to import and is not needed while the names are in the on-disk cache.
+        import yaml
+
+        # libyaml parser is much faster than the pure Python one.
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        with open_text(path) as fh:
+            manifest = yaml.load(fh, Loader=loader)
+
+        return manifest['name']['']
+
+
+protoblocks = ProtoblockNames()
+
+
+def get_workflow_path(path: str) -> Location:
+    """Returns a location of workflow.json of the project: a directory, a .p7wf archive or a git object rev:path.
+
+    Any other path is returned as it is.
+    """
+
+    if is_git_spec(path):
+        location = get_git_object(path)
+        return join_location(location, '.p7', 'workflow.json') if get_git_type(location) == 'tree' else location
+    if os.path.isdir(path):
+        return os.path.join(path, '.p7', 'workflow.json')
+    if is_archive(path):
+        return find_archive_workflow(path)
+
+    logger.debug(path)
+    return path
+
+
+def get_protoblocks_path(workflow_path: Location) -> Location | None:
+    """Returns a location of the protoblocks directory next to workflow.json, given by get_workflow_path."""
+
+    path = join_location(get_parent(workflow_path), 'protoblocks')
+    if not is_directory(path):
+        logger.warning("It is not possible to find protoblocks on the specified path.")
+        return None
+
+    return path
+
+
+def _get_names(value: str) -> list[str]:
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def add_loader_args(parser: argparse.ArgumentParser):
+    """Adds the options of loading workflows and of the on-disk caches."""
+
+    parser.add_argument("-s", "--stream", help="Parse workflow.json item by item to save memory",
+                        action="store_true")
+    parser.add_argument("--no-cache", help="Do not use the on-disk caches", action="store_true")
+    parser.add_argument("--cache-limit", help="Size limit of the workflow snapshots cache in MiB",
+                        type=int, default=512)
+
+
+def add_comparer_args(parser: argparse.ArgumentParser):
+    """Adds the options which select comparers (blocks, block_edits, links, ports, port_edits and plugins) and
+    what they compare."""
+
+    parser.add_argument("--only", help="Run only these comparers, comma separated", type=_get_names)
+    parser.add_argument("--skip", help="Do not run these comparers, comma separated", type=_get_names, default=[])
+    parser.add_argument("--scope", help='Compare only the block with its descendants, by a guid or by a path '
+                                        'like "Parent / Child"', type=str)
+    parser.add_argument("--similarity", help="Pair deleted and added blocks which look like recreated ones",
+                        action="store_true")
+
+
 class Context:
     """Program context class."""
 
     first_path: str
     second_path: str
-    first_path_to_workflow: str
-    second_path_to_workflow: str
+    first_path_to_workflow: Location
+    second_path_to_workflow: Location
+    base_path: str | None
+    base_path_to_workflow: Location | None
+    streaming: bool
+    jobs: int
+    use_cache: bool
+    cache_limit: int
+    output_format: str
+    similarity: bool
+    scope: str | None
+    profile: bool
+    only: list[str] | None
+    skip: list[str]
+    profile_output: str | None
+    out_of_core: bool
+    watch: bool
+    impact: bool
 
     def __init__(self):
         args = self._get_args()
-        self.first_path = os.path.abspath(args.first_path)
-        self.second_path = os.path.abspath(args.second_path)
+        self.first_path = get_input_path(args.first_path)
+        self.second_path = get_input_path(args.second_path)
+        self.base_path = get_input_path(args.base) if args.base is not None else None
+        self.streaming = args.stream
+        self.jobs = args.jobs
+        self.use_cache = not args.no_cache
+        self.cache_limit = args.cache_limit
+        self.output_format = args.format
+        self.similarity = args.similarity
+        self.scope = args.scope
+        self.profile = args.profile or args.profile_output is not None
+        self.profile_output = args.profile_output
+        self.only = args.only
+        self.skip = args.skip
+        self.out_of_core = args.out_of_core
+        self.watch = args.watch
+        self.impact = args.impact
         self.get_paths_to_workflow()
 
     def get_paths_to_workflow(self):
-        if os.path.isdir(self.first_path):
-            self.first_path_to_workflow = os.path.join(self.first_path, '.p7', 'workflow.json')
+        self.first_path_to_workflow = get_workflow_path(self.first_path)
+        self.second_path_to_workflow = get_workflow_path(self.second_path)
+        if self.base_path is not None:
+            self.base_path_to_workflow = get_workflow_path(self.base_path)
         else:
-            logger.debug(self.first_path)
-            self.first_path_to_workflow = self.first_path
-        if os.path.isdir(self.second_path):
-            self.second_path_to_workflow = os.path.join(self.second_path, '.p7', 'workflow.json')
-        else:
-            logger.debug(self.second_path)
-            self.second_path_to_workflow = self.second_path
+            self.base_path_to_workflow = None
 
     @staticmethod
     def _get_args():
         """Getting arguments from the console."""
         parser = argparse.ArgumentParser(description='Add path to workflow directories.')
-        parser.add_argument('first_path', type=str, help='Path to first directory')
-        parser.add_argument('second_path', type=str, help='Path to second directory')
+        parser.add_argument('first_path', type=str, help='Path to first directory, .p7wf archive or git rev:path')
+        parser.add_argument('second_path', type=str, help='Path to second directory, .p7wf archive or git rev:path')
         parser.add_argument("-l", "--log", help="Write log into log.log", action="store_true")
+        add_loader_args(parser)
+        parser.add_argument("-j", "--jobs", help="Number of threads loading archives and git revisions and of "
+                                                  "processes comparing shards of large workflows",
+                            type=int, default=1)
+        parser.add_argument("-b", "--base", help="Path to common ancestor directory. The first and the second paths "
+                                                "are compared with it as ours and theirs", type=str)
+        parser.add_argument("-f", "--format", help="Output format: a text report or a json line per difference",
+                            choices=['text', 'jsonl'], default='text')
+        add_comparer_args(parser)
+        parser.add_argument("--profile", help="Print time, calls and allocations of every stage to stderr",
+                            action="store_true")
+        parser.add_argument("--profile-output", help="Write the profile: a Chrome trace if the file ends with .json, "
+                                                     "cProfile stats for pstats otherwise", type=str)
+        parser.add_argument("--out-of-core", help="Compare through a temporary SQLite database instead of memory, "
+                                                  "for workflows larger than RAM", action="store_true")
+        parser.add_argument("--impact", help="Report the blocks which get data from the changed ones through links",
+                            action="store_true")
+        parser.add_argument("--watch", help="Print the report again every time the second workflow is saved",
+                            action="store_true")
 
-        if parser.parse_args().log:
+        args = parser.parse_args()
+        if args.log:
             logging.basicConfig(level=logging.NOTSET, format='%(asctime)s %(name)-30s %(levelname)-8s %(message)s',
                                 datefmt='%m-%d %H:%M', filename='./log.log', filemode='w')
 
-        return parser.parse_args()
+        return args
 
     def load_protoblocks(self):
-        """Loads protoblock names."""
-
-        protoblocks.extend([self._get_protoblocks(self.first_path), self._get_protoblocks(self.second_path)])
+        """Sets up protoblock names. Manifests are read later, only for the Protoblocks which are printed."""
 
-    @staticmethod
-    def _get_protoblocks(path_of_directory: str) -> dict:
-        """Opens manifest.yaml about every protoblock from the directory and returns a dict(version_id: name)."""
-
-        dict_names = {}
-
-        if os.path.isdir(path_of_directory):
-            path = os.path.join(path_of_directory, '.p7',  'protoblocks')
-        else:
-            path = os.path.join(os.path.dirname(path_of_directory), 'protoblocks')
-
-        if os.path.exists(path):
-            list_of_protoblock_paths = [os.path.join(path, id_version) for id_version in os.listdir(path=path)
-                                        if os.path.isdir(os.path.join(path, id_version))]
-
-            for path in list_of_protoblock_paths:
-                path = os.path.abspath(path)
-                id_version = os.path.basename(path)
-                path = os.path.join(path, 'manifest.yaml')
-
-                try:
-                    with open(path, 'r', encoding='utf-8') as fh:
-                        manifest = yaml.load(fh, Loader=yaml.FullLoader)
-                    dict_names[id_version] = manifest['name']['']
-
-                except FileNotFoundError as ex:
-                    logger.warning(ex)
-        else:
-            logger.warning("It is not possible to find protoblocks on the specified path.")
+        paths = [self.first_path_to_workflow, self.second_path_to_workflow]
+        if self.base_path_to_workflow is not None:
+            paths.append(self.base_path_to_workflow)
 
-        return dict_names
+        protoblocks.configure([get_protoblocks_path(path) for path in paths], use_cache=self.use_cache)
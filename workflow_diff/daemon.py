@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import IO
+
+from context import protoblocks, get_workflow_path, get_protoblocks_path, add_loader_args
+from diffs import JsonlRenderer
+from errors import WorkflowError
+from loader import load_workflow, paused_gc
+from main import diff_workflows, set_logger
+from registry import get_comparers
+from snapshot import SnapshotCache, create_snapshots
+from sources import Location, get_input_path, get_stamp
+from workflow import Workflow
+
+logger = logging.getLogger(f'log.{__name__}')
+
+# Parsed Workflow with its index and hashes takes about 2.5 bytes of memory per byte of workflow.json.
+MEMORY_PER_FILE_BYTE = 3
+
+
+@dataclass(slots=True)
+class CachedWorkflow:
+    stamp: object
+    memory: int
+    workflow: Workflow
+
+
+class WorkflowCache:
+    """Parsed Workflows by location. A Workflow is reloaded when the mtime or the size of its file changes.
+
+    Members of archives are reloaded when the archive changes, git objects - when the object id changes.
+
+    The memory of the Workflows is estimated by the size of their files. Least recently used ones are evicted
+    when the estimate exceeds max_memory.
+    """
+
+    def __init__(self, max_memory: int, streaming: bool = False, snapshots: SnapshotCache | None = None):
+        self.max_memory = max_memory
+        self.streaming = streaming
+        self.snapshots = snapshots
+        self.memory = 0
+        self.hits = 0
+        self.loads = 0
+        self._entries = OrderedDict()
+
+    def get(self, path: Location) -> Workflow:
+        stamp, size = get_stamp(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry.stamp == stamp:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry.workflow
+
+        if entry is not None:
+            self._remove(path)
+
+        with paused_gc():
+            workflow = load_workflow(path, self.streaming, self.snapshots)
+        self.loads += 1
+
+        entry = CachedWorkflow(stamp, size * MEMORY_PER_FILE_BYTE, workflow)
+        self._entries[path] = entry
+        self.memory += entry.memory
+        self._evict()
+
+        return workflow
+
+    def _remove(self, path: Location):
+        self.memory -= self._entries.pop(path).memory
+
+    def _evict(self):
+        """Evicts the least recently used Workflows, but never the last one."""
+
+        while self.memory > self.max_memory and len(self._entries) > 1:
+            path = next(iter(self._entries))
+            self._remove(path)
+            logger.info(f'Workflow {path} has been evicted.')
+
+    def get_stats(self) -> dict:
+        return {'workflows': [str(path) for path in self._entries], 'memory': self.memory,
+                'max_memory': self.max_memory, 'hits': self.hits, 'loads': self.loads}
+
+
+class DiffServer:
+    """Answers requests given as json lines. Every request gets json lines of Diffs and a final line.
+
+    Requests:
+        {"id": 1, "old": PATH, "new": PATH, "only": [...], "skip": [...], "similarity": false, "impact": false}
+            - diff two projects
+        {"id": 2, "command": "stats"} - state of the cache
+        {"id": 3, "command": "shutdown"} - stop the server
+    Every line of the answer has the id of the request. The final line has "done": true or "error": MESSAGE.
+    """
+
+    def __init__(self, cache: WorkflowCache, use_cache: bool = True):
+        self.cache = cache
+        self.use_cache = use_cache
+        self.running = True
+
+    def serve(self, reader: IO[str], writer: IO[str]):
+        """Answers the requests from the reader until it is closed or the server is shut down."""
+
+        for line in reader:
+            if not line.strip():
+                continue
+            self.handle(line, writer)
+            writer.flush()
+            if not self.running:
+                break
+
+    def handle(self, line: str, writer: IO[str]):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            command = request.get('command', 'diff')
+
+            if command == 'diff':
+                count = self.diff(request, writer)
+                answer = {'done': True, 'count': count}
+            elif command == 'stats':
+                answer = {'done': True, 'stats': self.cache.get_stats()}
+            elif command == 'shutdown':
+                self.running = False
+                answer = {'done': True}
+            else:
+                answer = {'error': f'Unknown command "{command}"'}
+        except WorkflowError as ex:
+            logger.error(f'Request {request_id} has failed: {ex}')
+            answer = {'error': str(ex)}
+        except (OSError, ValueError, KeyError) as ex:
+            # Broken requests and missing files are the client's mistakes, the server goes on.
+            logger.error(f'Request {request_id} has failed: {ex!r}')
+            answer = {'error': f'{type(ex).__name__}: {ex}'}
+        except Exception as ex:
+            logger.exception(ex)
+            answer = {'error': f'{type(ex).__name__}: {ex}'}
+
+        answer = {'id': request_id} | answer | {'seconds': round(time.perf_counter() - start, 6)}
+        writer.write(json.dumps(answer, ensure_ascii=False) + '\n')
+
+    def diff(self, request: dict, writer: IO[str]) -> int:
+        """Writes the Diffs of the old and the new projects and returns their number."""
+
+        paths = [get_workflow_path(get_input_path(request[key])) for key in ('old', 'new')]
+        protoblocks.configure([get_protoblocks_path(path) for path in paths], use_cache=self.use_cache)
+        # Manifests may have been edited since the last request. The on-disk cache checks their mtime and size,
+        # so reading the names again is cheap.
+        protoblocks.clear()
+        old_workflow, new_workflow = (self.cache.get(path) for path in paths)
+        for workflow in (old_workflow, new_workflow):
+            workflow.index.clear_paths()
+
+        renderer = _CountingRenderer(writer, {'id': request.get('id')})
+        comparers = get_comparers(request.get('only'), request.get('skip', ()))
+        diff_workflows(old_workflow, new_workflow, renderer, comparers, similarity=request.get('similarity', False),
+                       impact=request.get('impact', False))
+
+        return renderer.count
+
+
+class _CountingRenderer(JsonlRenderer):
+    """Counts the rendered Diffs."""
+
+    def __init__(self, file: IO[str], extra: dict):
+        super().__init__(file, extra)
+        self.count = 0
+
+    def add(self, diff, **extra):
+        self.count += 1
+        super().add(diff, **extra)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        reader = (line.decode('utf-8') for line in self.rfile)
+        writer = _SocketWriter(self.wfile)
+        self.server.diff_server.serve(reader, writer)
+
+
+class _SocketWriter:
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, text: str):
+        self._file.write(text.encode('utf-8'))
+
+    def flush(self):
+        self._file.flush()
+
+
+def serve_socket(diff_server: DiffServer, path: str):
+    """Serves the connections to the Unix socket one by one, until a shutdown request."""
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    with socketserver.UnixStreamServer(path, _Handler) as server:
+        server.diff_server = diff_server
+        logger.info(f'Listening on {path}')
+        try:
+            while diff_server.running:
+                server.handle_request()
+        finally:
+            os.unlink(path)
+
+
+def get_args():
+    """Getting arguments from the console."""
+    parser = argparse.ArgumentParser(description='Keep workflows in memory and answer diff requests given as json '
+                                                 'lines on stdin or on a Unix socket.')
+    parser.add_argument('--socket', type=str, help='Path of the Unix socket. Requests are read from stdin by default')
+    parser.add_argument('--memory-limit', help='Estimated memory limit of the cached workflows in MiB',
+                        type=int, default=1024)
+    add_loader_args(parser)
+
+    return parser.parse_args()
+
+
+def controller():
+    set_logger()
+    args = get_args()
+
+    snapshots = create_snapshots(not args.no_cache, args.cache_limit)
+    cache = WorkflowCache(args.memory_limit * 1024 * 1024, streaming=args.stream, snapshots=snapshots)
+    diff_server = DiffServer(cache, use_cache=not args.no_cache)
+
+    if args.socket is not None:
+        serve_socket(diff_server, args.socket)
+    else:
+        diff_server.serve(sys.stdin, sys.stdout)
+
+
+if __name__ == '__main__':
+    controller()
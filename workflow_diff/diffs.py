@@ -1,7 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from abc import ABC
+from typing import IO, Iterable, TYPE_CHECKING
+import json
 import logging
-from blocks import BlockSettings
+import sys
+
+if TYPE_CHECKING:
+    from blocks import BlockSettings
 
 logger = logging.getLogger(f'log.{__name__}')
 
@@ -11,6 +16,7 @@ class Diff(ABC):
     """Class of difference between two objects."""
 
     block_path: str
+    guid: str
 
     def __str__(self):
         return self.block_path
@@ -31,6 +37,8 @@ class DiffLink(Diff):
     port: str
     block_path2: str
     port2: str
+    src: str
+    dst: str
 
     def __str__(self):
         return f'{self.block_path}, {self.port}  ->  {self.block_path2}, {self.port2}'
@@ -53,6 +61,7 @@ class DiffEdit(Diff):
 
 @dataclass(slots=True)
 class DiffEditName(DiffEdit):
+    old_name: str
     new_name: str
 
     def __str__(self):
@@ -70,15 +79,28 @@ class DiffEditDiscr(DiffEdit):
 
 @dataclass(slots=True)
 class DiffEditPos(DiffEdit):
+    old_pos: tuple[int]
     new_pos: tuple[int]
 
     def __str__(self):
         return f'{self.block_path}: Has been moved to {self.new_pos}'
 
 
+@dataclass(slots=True)
+class DiffEditRecreate(DiffEdit):
+    old_block_path: str
+    old_guid: str
+
+    def __str__(self):
+        if self.old_block_path != self.block_path:
+            return f'{self.block_path}: Has been recreated from "{self.old_block_path}"'
+        return f'{self.block_path}: Has been recreated with a new guid'
+
+
 @dataclass(slots=True)
 class DiffEditPort(DiffEdit):
     port: str
+    port_guid: str
 
 
 @dataclass(slots=True)
@@ -99,6 +121,7 @@ class DiffEditPortDel(DiffEditPort):
 
 @dataclass(slots=True)
 class DiffEditPortName(DiffEditPort):
+    old_name: str
     new_name: str
 
     def __str__(self):
@@ -107,71 +130,169 @@ class DiffEditPortName(DiffEditPort):
 
 @dataclass(slots=True)
 class DiffEditPortFlag(DiffEditPort):
-    flag: bool
+    old_flag: bool
+    new_flag: bool
 
 
 @dataclass(slots=True)
 class DiffEditPortFlagP(DiffEditPortFlag):
 
     def __str__(self):
-        return f'{self.block_path}: Port {self.port} - flag "P" has been changed to "{self.flag}"'
+        return f'{self.block_path}: Port {self.port} - flag "P" has been changed to "{self.new_flag}"'
 
 
 @dataclass(slots=True)
 class DiffEditPortFlagB(DiffEditPortFlag):
 
     def __str__(self):
-        return f'{self.block_path}: Port {self.port} - flag "B" has been changed to "{self.flag}"'
+        return f'{self.block_path}: Port {self.port} - flag "B" has been changed to "{self.new_flag}"'
 
 
 @dataclass(slots=True)
 class DiffEditPortFlagR(DiffEditPortFlag):
 
     def __str__(self):
-        return f'{self.block_path}: Port {self.port} - flag "R" has been changed to "{self.flag}"'
+        return f'{self.block_path}: Port {self.port} - flag "R" has been changed to "{self.new_flag}"'
 
 
 @dataclass(slots=True)
 class DiffEditSettings(DiffEdit):
-    settings: BlockSettings
+    old_settings: 'BlockSettings'
+    new_settings: 'BlockSettings'
+
+    def __str__(self):
+        return f'{self.block_path}: Settings have been changed to {self.new_settings.get_title()}'
+
+
+@dataclass(slots=True)
+class DiffConflict(Diff):
+    reason: str
+
+    def __str__(self):
+        return f'{self.block_path}: {self.reason}'
+
+
+@dataclass(slots=True)
+class DiffConflictBlock(DiffConflict):
+    pass
+
+
+@dataclass(slots=True)
+class DiffConflictPort(DiffConflict):
+    port: str
+
+    def __str__(self):
+        return f'{self.block_path}: Port {self.port} - {self.reason}'
+
+
+@dataclass(slots=True)
+class DiffConflictLink(DiffConflict):
+    port: str
+    block_path2: str
+    port2: str
+
+    def __str__(self):
+        return f'{self.block_path}, {self.port}  ->  {self.block_path2}, {self.port2}: {self.reason}'
+
+
+@dataclass(slots=True)
+class DiffImpact(Diff):
+    """A Block which is not changed itself, but gets data from a changed one through the links."""
+
+    source_path: str
+    source_guid: str
 
     def __str__(self):
-        return f'{self.block_path}: Settings have been changed to {self.settings.get_title()}'
+        return f'{self.block_path}: Gets data from "{self.source_path}"'
+
+
+class TextRenderer:
+    """Renders Diffs as the report for a human. Diffs are grouped in one pass and printed when the stream ends."""
+
+    def __init__(self, file: IO[str] | None = None):
+        self.file = file if file is not None else sys.stdout
+        self.count = 0
+        self.added = []
+        self.deleted = []
+        self.edited = []
+        self.link_added = []
+        self.link_deleted = []
+        self.impacted = []
+
+    def add(self, diff: Diff):
+        self.count += 1
+
+        if isinstance(diff, DiffAdd):
+            self.added.append(diff)
+        elif isinstance(diff, DiffDel):
+            self.deleted.append(diff)
+        elif isinstance(diff, DiffEdit):
+            self.edited.append(diff)
+        elif isinstance(diff, DiffLinkAdd):
+            self.link_added.append(diff)
+        elif isinstance(diff, DiffLinkDel):
+            self.link_deleted.append(diff)
+        elif isinstance(diff, DiffImpact):
+            self.impacted.append(diff)
+
+    def close(self):
+        if self.count == 0:
+            print("No differences!", file=self.file)
+            return
+
+        sections = [
+            ('Blocks have been deleted:', self.deleted, False),
+            ('Blocks have been added:', self.added, False),
+            ('Blocks have been edited:', self.edited, True),
+            ('Links have been deleted:', self.link_deleted, True),
+            ('Links have been added:', self.link_added, True),
+            ('Blocks have been affected downstream:', self.impacted, True),
+        ]
+
+        for title, diffs, to_sort in sections:
+            if diffs:
+                print(f'\n{title}', file=self.file)
+                if to_sort:
+                    diffs = sorted(diffs, key=lambda res: res.block_path)
+                for diff in diffs:
+                    print(diff, file=self.file)
+
+
+class JsonlRenderer:
+    """Renders every Diff as a json line as soon as it is received. Fields of extra are added to every line."""
+
+    def __init__(self, file: IO[str] | None = None, extra: dict | None = None):
+        self.file = file if file is not None else sys.stdout
+        self.extra = extra if extra is not None else {}
+
+    def add(self, diff: Diff, **extra):
+        self.file.write(json.dumps(diff_to_record(diff) | self.extra | extra, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.flush()
+
+
+RENDERERS = {
+    'text': TextRenderer,
+    'jsonl': JsonlRenderer,
+}
+
+
+def diff_to_record(diff: Diff) -> dict:
+    """Returns a typed dictionary of the Diff with all its fields."""
+
+    return {'kind': type(diff).__name__} | asdict(diff)
+
+
+def render(diffs: Iterable[Diff], renderer: TextRenderer | JsonlRenderer):
+    """Passes every Diff of the stream to the renderer."""
+
+    for diff in diffs:
+        renderer.add(diff)
+    renderer.close()
 
 
-def print_diffs(list_diffs: list[Diff]):
+def print_diffs(list_diffs: Iterable[Diff]):
     """Prints a list of Diffs"""
 
-    if len(list_diffs) == 0:
-        print("No differences!")
-    else:
-        added = [diff for diff in list_diffs if isinstance(diff, DiffAdd)]
-        deleted = [diff for diff in list_diffs if isinstance(diff, DiffDel)]
-        edited = [diff for diff in list_diffs if isinstance(diff, DiffEdit)]
-        link_added = [diff for diff in list_diffs if isinstance(diff, DiffLinkAdd)]
-        link_deleted = [diff for diff in list_diffs if isinstance(diff, DiffLinkDel)]
-
-        if deleted:
-            print('\nBlocks have been deleted:')
-            for diff in deleted:
-                print(diff)
-
-        if added:
-            print('\nBlocks have been added:')
-            for diff in added:
-                print(diff)
-
-        if edited:
-            print('\nBlocks have been edited:')
-            for diff in sorted(edited, key=lambda res: res.block_path):
-                print(diff)
-
-        if link_deleted:
-            print('\nLinks have been deleted:')
-            for diff in sorted(link_deleted, key=lambda res: res.block_path):
-                print(diff)
-
-        if link_added:
-            print('\nLinks have been added:')
-            for diff in sorted(link_added, key=lambda res: res.block_path):
-                print(diff)
+    render(list_diffs, TextRenderer())
@@ -0,0 +1,5 @@
+class WorkflowError(Exception):
+    """A workflow cannot be diffed: a missing or broken file, an ambiguous scope or an unknown comparer.
+
+    The console entry points log the message and exit, the daemon sends it to the client and goes on.
+    """
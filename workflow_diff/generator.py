@@ -0,0 +1,222 @@
+import argparse
+import copy
+import json
+import os.path
+import random
+import uuid
+import logging
+from dataclasses import dataclass, asdict
+
+import yaml
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+@dataclass(slots=True, frozen=True)
+class GeneratorOptions:
+    """Knobs of a synthetic pair of workflows."""
+
+    blocks: int = 1000
+    depth: int = 3
+    ports: int = 2
+    link_density: float = 1.0
+    change_ratio: float = 0.01
+    protoblocks: int = 10
+    seed: int = 1
+
+
+class WorkflowGenerator:
+    """Generates a synthetic workflow.json and its changed revision. The same options give the same workflows."""
+
+    def __init__(self, options: GeneratorOptions):
+        self.options = options
+        self._random = random.Random(options.seed)
+
+    def _guid(self) -> str:
+        return str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+
+    def _port(self, port_type: str, name: str) -> dict:
+        return {
+            'type': port_type,
+            'guid': self._guid(),
+            'name': name,
+            'parameter': self._random.random() < 0.3,
+            'batch': False,
+            'history': {'enabled': False},
+        }
+
+    def _block(self, number: int, parent: str | None, composite: bool) -> dict:
+        inputs = self.options.ports // 2
+        ports = [self._port('INPUT', f'in{index}') for index in range(inputs)] + \
+                [self._port('OUTPUT', f'out{index}') for index in range(self.options.ports - inputs)]
+
+        block = {
+            'guid': self._guid(),
+            'type': 'COMPOSITE' if composite else 'BLOCK',
+            'name': f'block{number}',
+            'parent': parent,
+            'ui': {'position': {'x': number % 100 * 10, 'y': number // 100 * 10}},
+            'description': None,
+            'description_default': {'': f'Description of block {number}'},
+            'ports': ports,
+            'idle_timeout_user': None,
+        }
+        if not composite:
+            block['protoblock'] = {'id': f'protoblock{number % self.options.protoblocks}', 'version': 1}
+
+        return block
+
+    def _link(self, blocks: list[dict], dst_block: dict) -> dict | None:
+        """Returns a Link from an output of a random Block to an input of the dst_block, or None if it is impossible."""
+
+        inputs = [port for port in dst_block['ports'] if port['type'] == 'INPUT']
+        src_block = self._random.choice(blocks)
+        outputs = [port for port in src_block['ports'] if port['type'] == 'OUTPUT']
+        if not inputs or not outputs or src_block is dst_block:
+            return None
+
+        return {
+            'guid': self._guid(),
+            'src': {'block': src_block['guid'], 'port': self._random.choice(outputs)['guid']},
+            'dst': {'block': dst_block['guid'], 'port': self._random.choice(inputs)['guid']},
+        }
+
+    def generate(self) -> dict:
+        """Returns a workflow with the options.blocks Blocks nested up to options.depth Composites deep."""
+
+        blocks = []
+        # Composites which can get children, by the level of nesting. A chain of Composites guarantees the depth.
+        parents = [None]
+        levels = {None: 0}
+
+        for number in range(self.options.blocks):
+            if number < self.options.depth:
+                parent = parents[-1]
+                composite = True
+            else:
+                parent = self._random.choice(parents)
+                composite = levels[parent] < self.options.depth and self._random.random() < 0.1
+
+            block = self._block(number, parent, composite)
+            blocks.append(block)
+            if composite:
+                levels[block['guid']] = levels[parent] + 1
+                if levels[block['guid']] < self.options.depth:
+                    parents.append(block['guid'])
+
+        links = []
+        for _ in range(round(len(blocks) * self.options.link_density)):
+            link = self._link(blocks, self._random.choice(blocks))
+            if link is not None:
+                links.append(link)
+
+        return {'version': 1, 'blocks': blocks, 'links': links}
+
+    def change(self, workflow: dict) -> dict:
+        """Returns a copy of the workflow with about options.change_ratio of the Blocks edited, deleted or added."""
+
+        changed = copy.deepcopy(workflow)
+        blocks = changed['blocks']
+        number_of_changes = round(len(blocks) * self.options.change_ratio)
+
+        edits = [self._rename, self._move, self._describe, self._customize, self._flag_port]
+        deleted = set()
+        for block in self._random.sample(blocks, min(number_of_changes, len(blocks))):
+            if block['type'] == 'BLOCK' and self._random.random() < 0.2:
+                deleted.add(block['guid'])
+            else:
+                self._random.choice(edits)(block)
+
+        deleted_ports = {port['guid'] for block in blocks if block['guid'] in deleted for port in block['ports']}
+        changed['blocks'] = [block for block in blocks if block['guid'] not in deleted]
+        changed['links'] = [link for link in changed['links']
+                            if link['src']['port'] not in deleted_ports and link['dst']['port'] not in deleted_ports]
+
+        for number in range(len(deleted)):
+            block = self._block(len(blocks) + number, None, False)
+            changed['blocks'].append(block)
+            link = self._link(changed['blocks'], block)
+            if link is not None:
+                changed['links'].append(link)
+
+        return changed
+
+    def _rename(self, block: dict):
+        block['name'] += ' renamed'
+
+    def _move(self, block: dict):
+        block['ui']['position']['x'] += 1000
+
+    def _describe(self, block: dict):
+        block['description'] = {'': 'Changed description'}
+
+    def _customize(self, block: dict):
+        block['resources_customized'] = {'run': {'requests': {'memory': 512, 'cpu': 2}}}
+
+    def _flag_port(self, block: dict):
+        if block['ports']:
+            port = self._random.choice(block['ports'])
+            port['parameter'] = not port['parameter']
+
+
+def write_project(path: str, workflow: dict, options: GeneratorOptions):
+    """Writes the workflow as a project directory with .p7/workflow.json and manifests of the protoblocks."""
+
+    p7_path = os.path.join(path, '.p7')
+    os.makedirs(p7_path, exist_ok=True)
+    with open(os.path.join(p7_path, 'workflow.json'), 'w', encoding='utf-8') as fh:
+        json.dump(workflow, fh)
+
+    for number in range(options.protoblocks):
+        manifest_path = os.path.join(p7_path, 'protoblocks', f'protoblock{number}-1')
+        os.makedirs(manifest_path, exist_ok=True)
+        with open(os.path.join(manifest_path, 'manifest.yaml'), 'w', encoding='utf-8') as fh:
+            yaml.safe_dump({'name': {'': f'Protoblock {number}'}}, fh)
+
+
+def generate_pair(path: str, options: GeneratorOptions) -> tuple[str, str]:
+    """Writes the old and the new projects into the directory and returns their paths."""
+
+    generator = WorkflowGenerator(options)
+    old_workflow = generator.generate()
+    new_workflow = generator.change(old_workflow)
+
+    paths = os.path.join(path, 'old'), os.path.join(path, 'new')
+    write_project(paths[0], old_workflow, options)
+    write_project(paths[1], new_workflow, options)
+    logger.info(f'Pair of workflows has been generated in {path}: {asdict(options)}')
+
+    return paths
+
+
+def add_generator_args(parser: argparse.ArgumentParser):
+    """Adds the knobs of GeneratorOptions to the parser."""
+
+    defaults = GeneratorOptions()
+    parser.add_argument('--blocks', help='Number of blocks', type=int, default=defaults.blocks)
+    parser.add_argument('--depth', help='Depth of nesting of composites', type=int, default=defaults.depth)
+    parser.add_argument('--ports', help='Ports per block', type=int, default=defaults.ports)
+    parser.add_argument('--link-density', help='Links per block', type=float, default=defaults.link_density)
+    parser.add_argument('--change-ratio', help='Part of blocks changed in the new workflow', type=float,
+                        default=defaults.change_ratio)
+    parser.add_argument('--protoblocks', help='Number of protoblocks', type=int, default=defaults.protoblocks)
+    parser.add_argument('--seed', help='Seed of the random generator', type=int, default=defaults.seed)
+
+
+def get_generator_options(args: argparse.Namespace) -> GeneratorOptions:
+    return GeneratorOptions(blocks=args.blocks, depth=args.depth, ports=args.ports, link_density=args.link_density,
+                            change_ratio=args.change_ratio, protoblocks=args.protoblocks, seed=args.seed)
+
+
+def controller():
+    parser = argparse.ArgumentParser(description='Generate a synthetic pair of workflows.')
+    parser.add_argument('output', type=str, help='Directory for the old and the new projects')
+    add_generator_args(parser)
+    args = parser.parse_args()
+
+    old_path, new_path = generate_pair(args.output, get_generator_options(args))
+    print(f'{old_path}\n{new_path}')
+
+
+if __name__ == '__main__':
+    controller()
@@ -0,0 +1,36 @@
+import hashlib
+from typing import TYPE_CHECKING
+from port import PortSlice
+import logging
+
+if TYPE_CHECKING:
+    from blocks import Block
+
+logger = logging.getLogger(f'log.{__name__}')
+
+DIGEST_SIZE = 16
+
+
+def content_hash(block: 'Block') -> bytes:
+    """Returns a digest of the Block content: all its fields including ports, settings, description and position.
+
+    Equal digests are taken for equal content without comparing the values, so it must be a real digest
+    of the values (ports column by column), not a Python hash which collides like hash(-1) == hash(-2).
+    """
+
+    values = (type(block).__name__,) + tuple(
+        value.get_content() if isinstance(value, PortSlice) else value for value in block.get_values()
+    )
+
+    return hashlib.blake2b(repr(values).encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def subtree_hash(own_hash: bytes, children_hashes: list[bytes]) -> bytes:
+    """Rolls up the hash of the Block with the subtree hashes of its children (in guid order)."""
+
+    digest = hashlib.blake2b(own_hash, digest_size=DIGEST_SIZE)
+    for child_hash in children_hashes:
+        digest.update(child_hash)
+
+    return digest.digest()
+
@@ -0,0 +1,87 @@
+from collections import deque
+from typing import Iterable, Iterator
+
+from blocks import Composite
+from diffs import Diff, DiffAdd, DiffEdit, DiffEditPort, DiffEditPos, DiffImpact, DiffLink
+from workflow import Workflow
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+OUTPUT = 'OUTPUT'
+
+
+def add_sources(workflow: Workflow, diff: Diff, sources: dict[str, str]):
+    """Adds the Ports of the new Workflow where the change of the Diff enters the dataflow.
+
+    sources maps port guids to guids of the changed Blocks. Moving a Block does not change the data it passes.
+    """
+
+    index = workflow.index
+    if isinstance(diff, DiffLink):
+        found = index.find_port(diff.dst)
+        if found is not None and found[0].guid in index.blocks:
+            sources.setdefault(diff.dst, found[0].guid)
+    elif isinstance(diff, DiffEditPort) and index.find_port(diff.port_guid) is not None:
+        sources.setdefault(diff.port_guid, diff.guid)
+    elif isinstance(diff, (DiffAdd, DiffEdit)) and not isinstance(diff, DiffEditPos):
+        block = index.blocks.get(diff.guid)
+        if block is not None:
+            for port in block.ports:
+                sources.setdefault(port.guid, block.guid)
+
+
+def find_affected(workflow: Workflow, sources: dict[str, str]) -> dict[str, str]:
+    """Returns guids of the Blocks reached from the sources, with guids of the changed Blocks they are reached from.
+
+    The dataflow graph has an edge for every Link and edges from the inputs to the outputs of every Protoblock.
+    Composites pass data only through the Links of their children. All sources are walked in one breadth-first
+    traversal, so every Port is visited once and the outputs of every Protoblock are added once.
+    """
+
+    ports = workflow.index.ports
+    from_port = workflow.links.from_port
+    origins = dict(sources)
+    queue = deque(sources)
+    passed = set()
+    affected = {}
+
+    while queue:
+        port_guid = queue.popleft()
+        origin = origins[port_guid]
+        block, port = ports[port_guid]
+        if block.guid not in affected:
+            affected[block.guid] = origin
+
+        reached = [link.dst for link in from_port(port_guid)]
+        if block.guid not in passed and not isinstance(block, Composite) and port.type != OUTPUT:
+            passed.add(block.guid)
+            reached += block.ports.get_guids(OUTPUT)
+
+        for guid in reached:
+            if guid not in origins and guid in ports:
+                origins[guid] = origin
+                queue.append(guid)
+
+    logger.info(f'{len(origins)} ports of {len(affected)} blocks are reached from {len(sources)} changed ports.')
+
+    return affected
+
+
+def with_impact(workflow: Workflow, diffs: Iterable[Diff]) -> Iterator[Diff]:
+    """Yields the Diffs and then a DiffImpact for every unchanged Block downstream of the changes, in the file order."""
+
+    sources = {}
+    for diff in diffs:
+        add_sources(workflow, diff, sources)
+        yield diff
+
+    index = workflow.index
+    affected = find_affected(workflow, sources)
+    changed = set(sources.values())
+
+    # Blocks out of the scope of a scoped Workflow are walked through, but not reported.
+    guids = [guid for guid in affected.keys() - changed if guid in index.blocks]
+    for guid in sorted(guids, key=index.order.__getitem__):
+        source = index.blocks[affected[guid]]
+        yield DiffImpact(index.blocks[guid].get_path(index), guid, source.get_path(index), source.guid)
@@ -0,0 +1,179 @@
+from functools import cached_property
+from blocks import Block
+from port import Port
+from hashing import content_hash, subtree_hash
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+class WorkflowIndex:
+    """Guid lookups over the Blocks of a Workflow, built once and shared by all comparers."""
+
+    blocks: dict[str, Block]
+    ports: dict[str, tuple[Block, Port]]
+    children: dict[str | None, list[Block]]
+    order: dict[str, int]
+
+    def __init__(self, blocks: list[Block], context_blocks: list[Block] = ()):
+        self.blocks = {}
+        # Context Blocks of a scoped Workflow are used only for paths and ports lookups.
+        self._context = {block.guid: block for block in context_blocks}
+        self.ports = {}
+        self.children = {}
+        self.order = {}
+        self._paths = {}
+
+        for number, block in enumerate(blocks):
+            self.blocks[block.guid] = block
+            self.order[block.guid] = number
+            self.children.setdefault(block.parent, []).append(block)
+            for port in block.ports:
+                self.ports[port.guid] = (block, port)
+        for block in context_blocks:
+            for port in block.ports:
+                self.ports[port.guid] = (block, port)
+
+        logger.debug(f'Index consists of {len(self.blocks)} blocks and {len(self.ports)} ports.')
+
+    def find_port(self, port_guid: str) -> tuple[Block, Port] | None:
+        """Finds a Block and its Port by the port guid."""
+
+        return self.ports.get(port_guid)
+
+    def get_path(self, block: Block) -> str:
+        """Returns a path of Blocks parents. Paths of the parents are memoized."""
+
+        path = self._paths.get(block.guid)
+        if path is not None:
+            return path
+
+        # Walk up until a memoized (or root) ancestor is found, then fill the paths on the way back down.
+        chain = [block]
+        parent = self._get_block(block.parent)
+        while parent is not None and parent.guid not in self._paths:
+            chain.append(parent)
+            parent = self._get_block(parent.parent)
+
+        path = self._paths[parent.guid] if parent is not None else None
+        for ancestor in reversed(chain):
+            path = ancestor.get_title() if path is None else f'{path} / {ancestor.get_title()}'
+            self._paths[ancestor.guid] = path
+
+        return path
+
+    def clear_paths(self):
+        """Forgets the memoized paths. Titles of Protoblocks in them change with their manifests."""
+
+        self._paths = {}
+
+    def _get_block(self, guid: str | None) -> Block | None:
+        block = self.blocks.get(guid)
+        return block if block is not None else self._context.get(guid)
+
+    @property
+    def roots(self) -> list[Block]:
+        """Returns Blocks without a parent in the workflow."""
+
+        return [block for block in self.blocks.values() if block.parent not in self.blocks]
+
+    @cached_property
+    def content_hashes(self) -> dict[str, bytes]:
+        """Hashes of the Blocks content by guid."""
+
+        return {guid: content_hash(block) for guid, block in self.blocks.items()}
+
+    @cached_property
+    def subtree_hashes(self) -> dict[str, bytes]:
+        """Merkle hashes of the Blocks by guid: the content hash rolled up with the subtree hashes of the children."""
+
+        hashes = {}
+        stack = [(block, False) for block in self.roots]
+
+        while stack:
+            block, children_done = stack.pop()
+            children = self.children.get(block.guid, [])
+
+            if children_done:
+                hashes[block.guid] = subtree_hash(
+                    self.content_hashes[block.guid],
+                    [hashes[child.guid] for child in sorted(children, key=lambda child: child.guid)]
+                )
+            else:
+                stack.append((block, True))
+                stack.extend((child, False) for child in children)
+
+        return hashes
+
+    @classmethod
+    def from_previous(cls, previous: 'WorkflowIndex', blocks: list[Block], deleted: list[Block],
+                      added: list[Block]) -> 'WorkflowIndex':
+        """Builds the index of a new version of the workflow from the index of its previous version.
+
+        deleted are the Blocks of the previous version which are not in blocks, added are the new ones, so an edited
+        Block is in both. Only their lookups are updated, and only their hashes and the subtree hashes of their
+        parents and ancestors are computed. Blocks out of reach of the roots, which only a cycle of parents makes,
+        are left to a new index.
+        """
+
+        if len(previous.subtree_hashes) != len(previous.blocks):
+            return cls(blocks)
+
+        index = cls.__new__(cls)
+        index.blocks = {block.guid: block for block in blocks}
+        index.order = {block.guid: number for number, block in enumerate(blocks)}
+        index._context = {}
+        index._paths = {}
+
+        index.ports = dict(previous.ports)
+        for block in deleted:
+            for port in block.ports:
+                del index.ports[port.guid]
+        for block in added:
+            for port in block.ports:
+                index.ports[port.guid] = (block, port)
+
+        index.children = dict(previous.children)
+        parents = {block.parent for block in deleted} | {block.parent for block in added}
+        for parent in parents:
+            # Lists are shared with the previous index, so they are replaced, not changed.
+            children = {child.guid: child for child in index.children.get(parent, [])
+                        if index.blocks.get(child.guid) is child}
+            children.update((block.guid, block) for block in added if block.parent == parent)
+            if children:
+                index.children[parent] = sorted(children.values(), key=lambda child: index.order[child.guid])
+            else:
+                index.children.pop(parent, None)
+
+        content = dict(previous.content_hashes)
+        for block in deleted:
+            content.pop(block.guid, None)
+        for block in added:
+            content[block.guid] = content_hash(block)
+
+        dirty = {}
+        for guid in parents | {block.guid for block in added}:
+            chain = {}
+            while guid in index.blocks and guid not in dirty and guid not in chain:
+                chain[guid] = None
+                guid = index.blocks[guid].parent
+            if guid in chain:
+                return cls(blocks)
+            depth = dirty[guid] if guid in dirty else -1
+            for ancestor in reversed(chain):
+                depth += 1
+                dirty[ancestor] = depth
+
+        hashes = dict(previous.subtree_hashes)
+        for block in deleted:
+            hashes.pop(block.guid, None)
+        # Deeper Blocks first, so hashes of the children are ready.
+        for guid in sorted(dirty, key=dirty.get, reverse=True):
+            children = sorted(index.children.get(guid, []), key=lambda child: child.guid)
+            hashes[guid] = subtree_hash(content[guid], [hashes[child.guid] for child in children])
+
+        index.__dict__['content_hashes'] = content
+        index.__dict__['subtree_hashes'] = hashes
+        logger.debug(f'Index has been updated with {len(deleted)} deleted and {len(added)} added blocks.')
+
+        return index
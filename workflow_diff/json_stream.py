@@ -0,0 +1,116 @@
+import json
+from typing import IO, Iterator
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+
+
+class JsonArrayStream:
+    """Reads a json object from a file and yields the items of its top level arrays one by one.
+
+    Only one item (or one skipped value) has to be in memory at a time, so the whole document never exists in full.
+    """
+
+    keys: set[str]
+
+    def __init__(self, file: IO[str], chunk_size: int = 1 << 16):
+        self.keys = set()
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def items(self, array_keys: set[str]) -> Iterator[tuple[str, object]]:
+        """Yields (key, item) for every item of the top level arrays named in array_keys. Other values are skipped.
+
+        Every top level key which has been met is recorded in self.keys.
+        """
+
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._decode()
+            self.keys.add(key)
+            self._expect(':')
+
+            if key in array_keys and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield key, self._decode()
+                        if self._separator(']'):
+                            break
+            else:
+                self._decode()
+
+            if self._separator('}'):
+                return
+
+    def _fill(self) -> bool:
+        """Reads the next chunk into the buffer. Returns False at the end of the file."""
+
+        if self._eof:
+            return False
+
+        # Reading at least as much as is already pending keeps retries of big values linear.
+        pending = self._buffer[self._pos:]
+        chunk = self._file.read(max(self._chunk_size, len(pending)))
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = pending + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skips whitespaces and returns the next character ('' at the end of the file)."""
+
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self._buffer, self._pos)
+        self._pos += 1
+
+    def _separator(self, closing: str) -> bool:
+        """Consumes ',' or the closing bracket. Returns True if the bracket has been closed."""
+
+        char = self._peek()
+        if char not in (',', closing):
+            raise json.JSONDecodeError(f'Expecting \',\' or {closing!r}', self._buffer, self._pos)
+        self._pos += 1
+
+        return char == closing
+
+    def _decode(self) -> object:
+        """Decodes the next value, reading more chunks while the value is incomplete."""
+
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+
+            # A number or a literal may continue in the next chunk.
+            if (end == len(self._buffer) or self._buffer[end] not in DELIMITERS) and self._fill():
+                continue
+
+            self._pos = end
+            return value
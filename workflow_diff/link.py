@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Iterable, Iterator, KeysView
 
 
 @dataclass(slots=True, unsafe_hash=True)
@@ -8,3 +9,93 @@ class Link:
     guid: str = field(compare=True)
     src: str = field(compare=False)
     dst: str = field(compare=False)
+
+    def __reduce__(self):
+        return Link, (self.guid, self.src, self.dst)
+
+
+class LinkTable:
+    """Links of a Workflow in the file order, indexed by guid, by src port and by dst port.
+
+    Unlike a generator it can be iterated any number of times, and guids() supports fast set operations.
+    """
+
+    __slots__ = ('_links', '_by_src', '_by_dst')
+
+    def __init__(self, links: Iterable[Link] = ()):
+        self._links = {}
+        self._by_src = {}
+        self._by_dst = {}
+
+        for link in links:
+            self.add(link)
+
+    def add(self, link: Link):
+        self._links[link.guid] = link
+        self._by_src.setdefault(link.src, []).append(link)
+        self._by_dst.setdefault(link.dst, []).append(link)
+
+    def updated(self, links: list[Link], deleted: list[Link], added: list[Link]) -> 'LinkTable':
+        """Returns the table of links, which are the Links of this table without the deleted ones and with the added.
+
+        Only the port lookups of the changed Links are updated, the rest is shared with this table.
+        """
+
+        table = LinkTable()
+        table._links = {link.guid: link for link in links}
+        order = {guid: number for number, guid in enumerate(table._links)} if added else {}
+        table._by_src = _updated(self._by_src, deleted, added, 'src', order)
+        table._by_dst = _updated(self._by_dst, deleted, added, 'dst', order)
+
+        return table
+
+    def get(self, guid: str) -> Link | None:
+        return self._links.get(guid)
+
+    def guids(self) -> KeysView[str]:
+        """Returns a set-like view of the Links guids."""
+
+        return self._links.keys()
+
+    def from_port(self, port_guid: str) -> list[Link]:
+        """Returns Links which start at the Port."""
+
+        return self._by_src.get(port_guid, [])
+
+    def to_port(self, port_guid: str) -> list[Link]:
+        """Returns Links which end at the Port."""
+
+        return self._by_dst.get(port_guid, [])
+
+    def __iter__(self) -> Iterator[Link]:
+        return iter(self._links.values())
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    def __contains__(self, guid: str) -> bool:
+        return guid in self._links
+
+
+def _updated(by_port: dict[str, list[Link]], deleted: list[Link], added: list[Link], end: str,
+             order: dict[str, int]) -> dict[str, list[Link]]:
+    """Returns a copy of the port lookup. Lists of the changed ports are replaced, so the original stays intact.
+
+    The added Links are put by their numbers in the file order, so the lists are the same as after a full parse.
+    """
+
+    by_port = dict(by_port)
+    for link in deleted:
+        port = getattr(link, end)
+        links = [other for other in by_port[port] if other is not link]
+        if links:
+            by_port[port] = links
+        else:
+            del by_port[port]
+    added_by_port = {}
+    for link in added:
+        added_by_port.setdefault(getattr(link, end), []).append(link)
+    for port, links in added_by_port.items():
+        by_port[port] = sorted(by_port.get(port, []) + links, key=lambda link: order[link.guid])
+
+    return by_port
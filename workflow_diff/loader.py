@@ -0,0 +1,71 @@
+import gc
+from contextlib import contextmanager
+from functools import partial
+from context import Context
+from snapshot import SnapshotCache, create_snapshots
+from sources import Location
+from workflow import Workflow
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+@contextmanager
+def paused_gc():
+    """Pauses the cyclic garbage collector. Parsing creates millions of objects without cycles to collect."""
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_workflow(path: Location, streaming: bool = False, snapshots: SnapshotCache | None = None,
+                  scope: str | None = None) -> Workflow:
+    """Loads the Workflow from the snapshot of the file, or parses the file and stores its snapshot.
+
+    Scoped Workflows are always parsed, because parsing only the scope is the point of a scope.
+    """
+
+    if snapshots is None or scope is not None:
+        return Workflow.from_file(path, streaming=streaming, scope=scope)
+
+    try:
+        key = snapshots.get_key(path)
+    except FileNotFoundError:
+        # Let the parser report the missing file.
+        return Workflow.from_file(path, streaming=streaming)
+
+    workflow = snapshots.load(key)
+    if workflow is None:
+        workflow = Workflow.from_file(path, streaming=streaming)
+        snapshots.store(key, workflow)
+
+    return workflow
+
+
+def load_workflow_files(context: Context, paths: list[Location]) -> list[Workflow]:
+    """Sets up protoblock names and loads Workflows from the paths.
+
+    Protoblock names are resolved lazily, so loading does not depend on the manifests. Parsing holds the GIL,
+    so threads do not parse files on disk at the same time and they are loaded one after another. Members of
+    archives and git objects are loaded by context.jobs threads: their decompression and the git process run
+    without the GIL, while another Workflow is parsed.
+    """
+
+    context.load_protoblocks()
+    snapshots = create_snapshots(context.use_cache, context.cache_limit)
+
+    load = partial(load_workflow, streaming=context.streaming, snapshots=snapshots, scope=context.scope)
+
+    with paused_gc():
+        if context.jobs <= 1 or all(isinstance(path, str) for path in paths):
+            return [load(path) for path in paths]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=context.jobs) as executor:
+            return list(executor.map(load, paths))
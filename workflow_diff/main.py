@@ -1,11 +1,19 @@
 from context import Context
-from diffs import print_diffs
-from workflow import Workflow
+from errors import WorkflowError
+from sources import files_are_identical
 
-import importlib
-import pkgutil
 import logging
 
+# The modules of the pipeline are imported on first use, so short runs like identical files start fast.
+# Even typing and dataclasses are not imported on the way to the first diff.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterator
+    from diffs import Diff, JsonlRenderer, TextRenderer
+    from matching import Matching
+    from registry import Comparer
+    from workflow import Workflow
+
 
 def set_logger():
     """"""
@@ -18,27 +26,88 @@ def set_logger():
     logging.getLogger('log').addHandler(console)
 
 
-set_logger()
 logger = logging.getLogger(f'log.{__name__}')
 
 
-def get_comparers() -> list:
-    """Returning a list of comparers from 'comparers' package."""
+def instrument_pipeline():
+    """Records the lazy steps which are spread over the stages: manifests reading, index building and paths."""
 
-    folder_name = "comparers"
-    return [
-        importlib.import_module(f"{folder_name}.{name.name}")
-        for name in pkgutil.iter_modules([folder_name])
-    ]
+    from context import ProtoblockNames
+    from index import WorkflowIndex
+    from profiling import profiler
 
+    profiler.instrument(ProtoblockNames, '_read', 'manifests')
+    profiler.instrument(WorkflowIndex, '__init__', 'index')
+    profiler.instrument(WorkflowIndex.__dict__['content_hashes'], 'func', 'content_hashes')
+    profiler.instrument(WorkflowIndex.__dict__['subtree_hashes'], 'func', 'subtree_hashes')
+    profiler.instrument(WorkflowIndex, 'get_path', 'get_path')
 
-def controller():
 
-    context = Context()
-    context.load_protoblocks()
+def controller():
 
-    old_workflow = Workflow(path_to_workflow=context.first_path_to_workflow)
-    new_workflow = Workflow(path_to_workflow=context.second_path_to_workflow)
+    set_logger()
+    try:
+        context = Context()
+        if not context.profile:
+            run(context)
+            return
+
+        from profiling import profile_run
+
+        instrument_pipeline()
+        with profile_run(context.profile_output):
+            run(context)
+    except WorkflowError as ex:
+        logger.error(ex)
+        exit(-1)
+
+
+def run(context: Context):
+    if context.out_of_core and (context.base_path is not None or context.scope is not None or context.similarity):
+        logger.error('--out-of-core cannot be used with --base, --scope or --similarity.')
+        exit(-1)
+    if context.watch and (context.base_path is not None or context.scope is not None or context.out_of_core):
+        logger.error('--watch cannot be used with --base, --scope or --out-of-core.')
+        exit(-1)
+    if context.impact and (context.base_path is not None or context.out_of_core):
+        logger.error('--impact cannot be used with --base or --out-of-core.')
+        exit(-1)
+    if context.similarity and context.base_path is not None:
+        logger.error('--similarity cannot be used with --base.')
+        exit(-1)
+
+    if context.watch:
+        from watch import watch
+
+        watch(context)
+        return
+
+    if context.base_path is not None:
+        three_way_controller(context)
+        return
+
+    if files_are_identical(context.first_path_to_workflow, context.second_path_to_workflow):
+        # The same report as TextRenderer gives for no Diffs, without importing the pipeline at all.
+        if context.output_format == 'text':
+            print('No differences!')
+        return
+
+    from diffs import RENDERERS
+    from loader import load_workflow_files
+    from profiling import profiler
+    from registry import get_comparers
+
+    renderer = RENDERERS[context.output_format]()
+
+    if context.out_of_core:
+        from outofcore import diff_out_of_core
+
+        diff_out_of_core(context, renderer)
+        return
+
+    with profiler.stage('load'):
+        old_workflow, new_workflow = load_workflow_files(context, [context.first_path_to_workflow,
+                                                                   context.second_path_to_workflow])
 
     logger.debug('First workflow includes:\n')
     for block in old_workflow.blocks:
@@ -48,13 +117,97 @@ def controller():
     for block in new_workflow.blocks:
         logger.debug(block)
 
-    comparers = get_comparers()
-    diffs = []
+    diff_workflows(old_workflow, new_workflow, renderer, get_comparers(context.only, context.skip),
+                   similarity=context.similarity, jobs=context.jobs, impact=context.impact)
 
-    for comparer in comparers:
-        diffs += comparer.compare(old_workflow, new_workflow)
 
-    print_diffs(diffs)
+def diff_workflows(old_workflow: 'Workflow', new_workflow: 'Workflow', renderer: 'TextRenderer | JsonlRenderer',
+                   comparers: list['Comparer'], similarity: bool = False, jobs: int = 1, impact: bool = False):
+    """Matches two Workflows and passes the Diffs of all comparers to the renderer.
+
+    With similarity, deleted and added Blocks which look the same are paired as recreated.
+    The Workflows are matched only if some of the comparers need it or with similarity, because the links comparer
+    drops Links of recreated Blocks by the port aliases of the matching. With jobs > 1 the comparers may run on shards.
+    With impact, the Blocks of the new Workflow which get data from the changed ones follow the Diffs.
+    """
+
+    from diffs import render
+    from matching import Matching, match_workflows
+    from profiling import profiler
+    from registry import MATCHING, is_needed
+
+    if not is_needed(comparers, MATCHING) and not similarity:
+        matching = Matching()
+    else:
+        with profiler.stage('matching'):
+            matching = match_workflows(old_workflow, new_workflow)
+    if similarity:
+        from similarity import match_similar
+
+        with profiler.stage('similarity'):
+            match_similar(old_workflow, new_workflow, matching)
+
+    diffs = iter_diffs(old_workflow, new_workflow, comparers, matching, jobs)
+    if impact:
+        from impact import with_impact
+
+        diffs = with_impact(new_workflow, diffs)
+
+    with profiler.stage('render'):
+        render(diffs, renderer)
+
+
+def iter_diffs(old_workflow: 'Workflow', new_workflow: 'Workflow', comparers: list['Comparer'],
+               matching: 'Matching', jobs: int = 1) -> 'Iterator[Diff]':
+    """Yields Diffs of all comparers as soon as they are found.
+
+    With jobs > 1 a large Matching is split into shards compared by processes, and the Diffs come in the same order.
+    """
+
+    from profiling import profiler
+
+    if jobs > 1:
+        from shards import get_shard_count, iter_sharded_diffs
+
+        count = get_shard_count(matching, comparers, jobs)
+        if count > 1:
+            yield from iter_sharded_diffs(old_workflow, new_workflow, comparers, matching, count)
+            return
+
+    for comparer in comparers:
+        yield from profiler.iterate(f'comparer:{comparer.name}',
+                                    comparer.compare(old_workflow, new_workflow, matching))
+
+
+def three_way_controller(context: Context):
+    """Compares both workflows with the common ancestor. Exits with 1 if there are conflicts."""
+
+    from diffs import JsonlRenderer, render
+    from loader import load_workflow_files
+    from merge import three_way_diff, print_three_way
+    from profiling import profiler
+    from registry import get_comparers
+
+    with profiler.stage('load'):
+        ours, theirs, base = load_workflow_files(context, [context.first_path_to_workflow,
+                                                           context.second_path_to_workflow,
+                                                           context.base_path_to_workflow])
+
+    ours_diffs, theirs_diffs, conflicts = three_way_diff(base, ours, theirs,
+                                                         get_comparers(context.only, context.skip))
+
+    if context.output_format == 'jsonl':
+        renderer = JsonlRenderer()
+        for diff in ours_diffs:
+            renderer.add(diff, side='ours')
+        for diff in theirs_diffs:
+            renderer.add(diff, side='theirs')
+        render(conflicts, renderer)
+    else:
+        print_three_way(ours_diffs, theirs_diffs, conflicts)
+
+    if conflicts:
+        exit(1)
 
 
 if __name__ == '__main__':
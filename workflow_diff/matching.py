@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from blocks import Block
+from port import Port
+from workflow import Workflow
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+@dataclass(slots=True)
+class Matching:
+    """Blocks and Ports of two Workflows paired by guid. Built once and shared by all comparers.
+
+    Pairs of Blocks with the same content are left out. Blocks recreated with a new guid are paired only
+    by the optional similarity matching, their Ports guids are mapped by port_aliases.
+    """
+
+    blocks: list[tuple[Block, Block]] = field(default_factory=list)
+    added_blocks: list[Block] = field(default_factory=list)
+    deleted_blocks: list[Block] = field(default_factory=list)
+    ports: list[tuple[Block, Port, Port]] = field(default_factory=list)
+    added_ports: list[tuple[Block, Port]] = field(default_factory=list)
+    deleted_ports: list[tuple[Block, Port]] = field(default_factory=list)
+    similar_blocks: list[tuple[Block, Block]] = field(default_factory=list)
+    port_aliases: dict[str, str] = field(default_factory=dict)
+
+    def match_ports(self, old_block: Block, new_block: Block):
+        """Pairs the Ports of two same Blocks. Ports are kept together with the Block from the second workflow."""
+
+        new_ports = {port.guid: port for port in new_block.ports}
+
+        for old_port in old_block.ports:
+            new_port = new_ports.pop(old_port.guid, None)
+            if new_port is None:
+                self.deleted_ports.append((new_block, old_port))
+            else:
+                self.ports.append((new_block, old_port, new_port))
+
+        for new_port in new_ports.values():
+            self.added_ports.append((new_block, new_port))
+
+
+def find_changed_blocks(workflow: Workflow, other_workflow: Workflow) -> list[Block]:
+    """Returns Blocks of the workflow which are not in identical subtrees of the other workflow, in the file order.
+
+    Subtrees with the same Merkle hash in both workflows are pruned without visiting their descendants.
+    """
+
+    hashes = workflow.index.subtree_hashes
+    other_hashes = other_workflow.index.subtree_hashes
+
+    changed = []
+    stack = workflow.index.roots
+
+    while stack:
+        block = stack.pop()
+        if hashes[block.guid] == other_hashes.get(block.guid):
+            continue
+
+        changed.append(block)
+        stack.extend(workflow.index.children.get(block.guid, []))
+
+    return sorted(changed, key=lambda block: workflow.index.order[block.guid])
+
+
+def match_workflows(old_workflow: Workflow, new_workflow: Workflow) -> Matching:
+    """Pairs the Blocks and Ports of two Workflows by guid in one pass over each of them.
+
+    Identical subtrees are skipped and Blocks with the same content hash are not paired, because they have no edits.
+    """
+
+    matching = Matching()
+    old_index = old_workflow.index
+    new_index = new_workflow.index
+
+    for old_block in find_changed_blocks(old_workflow, new_workflow):
+        new_block = new_index.blocks.get(old_block.guid)
+        if new_block is None:
+            matching.deleted_blocks.append(old_block)
+        elif old_index.content_hashes[old_block.guid] != new_index.content_hashes[new_block.guid]:
+            matching.blocks.append((old_block, new_block))
+            matching.match_ports(old_block, new_block)
+
+    for new_block in find_changed_blocks(new_workflow, old_workflow):
+        if new_block.guid not in old_index.blocks:
+            matching.added_blocks.append(new_block)
+
+    logger.info(f'{len(matching.blocks)} blocks have been edited, {len(matching.added_blocks)} added '
+                f'and {len(matching.deleted_blocks)} deleted.')
+
+    return matching
@@ -0,0 +1,209 @@
+from blocks import Block, BlockSettings
+from diffs import Diff, DiffConflict, DiffConflictBlock, DiffConflictPort, DiffConflictLink, print_diffs
+from matching import Matching
+from port import Port
+from profiling import profiler
+from registry import Comparer
+from workflow import Workflow
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+BLOCK_FIELDS = {'name': 'name', 'position': 'position', 'description': 'description', 'settings': 'settings'}
+PORT_FIELDS = {'name': 'name', 'flag_p': 'flag "P"', 'flag_b': 'flag "B"', 'flag_r': 'flag "R"'}
+
+
+def match_three_way(base: Workflow, ours: Workflow, theirs: Workflow) -> tuple[Matching, Matching]:
+    """Pairs the Blocks and Ports of base with ours and with theirs in one pass over the guid indexes."""
+
+    ours_matching = Matching()
+    theirs_matching = Matching()
+    sides = ((ours.index, ours_matching), (theirs.index, theirs_matching))
+
+    for base_block in base.blocks:
+        base_hash = base.index.content_hashes[base_block.guid]
+
+        for index, matching in sides:
+            block = index.blocks.get(base_block.guid)
+            if block is None:
+                matching.deleted_blocks.append(base_block)
+            elif index.content_hashes[block.guid] != base_hash:
+                matching.blocks.append((base_block, block))
+                matching.match_ports(base_block, block)
+
+    for workflow, matching in ((ours, ours_matching), (theirs, theirs_matching)):
+        for block in workflow.blocks:
+            if block.guid not in base.index.blocks:
+                matching.added_blocks.append(block)
+
+    return ours_matching, theirs_matching
+
+
+def _title(value) -> str:
+    if isinstance(value, BlockSettings):
+        return value.get_title()
+
+    return f'"{value}"'
+
+
+def _changed_both(base_object: Block | Port, ours_object: Block | Port, theirs_object: Block | Port,
+                  fields: dict[str, str]) -> list[str]:
+    """Returns descriptions of the fields which have been changed differently in ours and theirs."""
+
+    reasons = []
+    for name, label in fields.items():
+        base_value = getattr(base_object, name)
+        ours_value = getattr(ours_object, name)
+        theirs_value = getattr(theirs_object, name)
+
+        if base_value != ours_value and base_value != theirs_value and ours_value != theirs_value:
+            reasons.append(f'The {label} has been changed to {_title(ours_value)} in ours '
+                           f'and to {_title(theirs_value)} in theirs')
+
+    return reasons
+
+
+def _is_port_edited(old_port: Port, new_port: Port) -> bool:
+    return any(getattr(old_port, name) != getattr(new_port, name) for name in PORT_FIELDS)
+
+
+def _base_path(base: Workflow, block: Block) -> str:
+    """Returns a path of the Block as it is in base."""
+
+    return base.index.get_path(base.index.blocks[block.guid])
+
+
+def _find_block_conflicts(base: Workflow, ours: Workflow, theirs: Workflow, ours_matching: Matching,
+                          theirs_matching: Matching) -> list[DiffConflict]:
+    conflicts = []
+    theirs_edited = {base_block.guid: block for base_block, block in theirs_matching.blocks}
+    ours_deleted = {block.guid for block in ours_matching.deleted_blocks}
+    theirs_deleted = {block.guid for block in theirs_matching.deleted_blocks}
+
+    for base_block, ours_block in ours_matching.blocks:
+        theirs_block = theirs_edited.get(base_block.guid)
+        if theirs_block is not None:
+            for reason in _changed_both(base_block, ours_block, theirs_block, BLOCK_FIELDS):
+                conflicts.append(DiffConflictBlock(base_block.get_path(base.index), base_block.guid, reason))
+        elif base_block.guid in theirs_deleted:
+            conflicts.append(DiffConflictBlock(base_block.get_path(base.index), base_block.guid,
+                                               'Has been edited in ours and deleted in theirs'))
+
+    for base_block, _ in theirs_matching.blocks:
+        if base_block.guid in ours_deleted:
+            conflicts.append(DiffConflictBlock(base_block.get_path(base.index), base_block.guid,
+                                               'Has been deleted in ours and edited in theirs'))
+
+    theirs_added = {block.guid: block for block in theirs_matching.added_blocks}
+    for ours_block in ours_matching.added_blocks:
+        theirs_block = theirs_added.get(ours_block.guid)
+        if theirs_block is not None and \
+                ours.index.content_hashes[ours_block.guid] != theirs.index.content_hashes[theirs_block.guid]:
+            conflicts.append(DiffConflictBlock(ours_block.get_path(ours.index), ours_block.guid,
+                                               'Has been added differently in ours and theirs'))
+
+    ours_deleted_ports = {port.guid for _, port in ours_matching.deleted_ports}
+    theirs_deleted_ports = {port.guid for _, port in theirs_matching.deleted_ports}
+    theirs_ports = {base_port.guid: port for _, base_port, port in theirs_matching.ports}
+
+    for ours_block, base_port, ours_port in ours_matching.ports:
+        theirs_port = theirs_ports.get(base_port.guid)
+
+        if theirs_port is not None:
+            for reason in _changed_both(base_port, ours_port, theirs_port, PORT_FIELDS):
+                conflicts.append(DiffConflictPort(_base_path(base, ours_block), ours_block.guid, reason,
+                                                  base_port.get_title()))
+        if base_port.guid in theirs_deleted_ports and _is_port_edited(base_port, ours_port):
+            conflicts.append(DiffConflictPort(_base_path(base, ours_block), ours_block.guid,
+                                              'Has been edited in ours and deleted in theirs', base_port.get_title()))
+
+    for theirs_block, base_port, theirs_port in theirs_matching.ports:
+        if base_port.guid in ours_deleted_ports and _is_port_edited(base_port, theirs_port):
+            conflicts.append(DiffConflictPort(_base_path(base, theirs_block), theirs_block.guid,
+                                              'Has been deleted in ours and edited in theirs', base_port.get_title()))
+
+    return conflicts
+
+
+def _deleted_port_guids(matching: Matching) -> set[str]:
+    """Returns guids of the Ports which have been deleted together with their Blocks or alone."""
+
+    deleted = {port.guid for _, port in matching.deleted_ports}
+    for block in matching.deleted_blocks:
+        deleted.update(port.guid for port in block.ports)
+
+    return deleted
+
+
+def _find_link_conflicts(base: Workflow, ours: Workflow, theirs: Workflow, ours_matching: Matching,
+                         theirs_matching: Matching) -> list[DiffConflict]:
+    conflicts = []
+    sides = ((ours, 'ours', _deleted_port_guids(theirs_matching), 'theirs'),
+             (theirs, 'theirs', _deleted_port_guids(ours_matching), 'ours'))
+
+    for workflow, name, deleted_ports, other_name in sides:
+        for link in workflow.links:
+            if link.guid in base.links:
+                continue
+
+            ours_link = ours.links.get(link.guid) if workflow is theirs else None
+
+            if link.src in deleted_ports or link.dst in deleted_ports:
+                reason = f'Link has been added in {name} to a port deleted in {other_name}'
+            elif ours_link is not None and (ours_link.src, ours_link.dst) != (link.src, link.dst):
+                reason = 'Link has been added differently in ours and theirs'
+            else:
+                continue
+
+            block1, port1 = workflow.index.find_port(link.src)
+            block2, port2 = workflow.index.find_port(link.dst)
+            conflicts.append(DiffConflictLink(block1.get_path(workflow.index), link.guid, reason,
+                                              port1.get_title(), block2.get_path(workflow.index), port2.get_title()))
+
+    return conflicts
+
+
+def find_conflicts(base: Workflow, ours: Workflow, theirs: Workflow, ours_matching: Matching,
+                   theirs_matching: Matching) -> list[DiffConflict]:
+    """Finds Blocks, Ports and Links which have been changed in both ours and theirs in an incompatible way."""
+
+    return _find_block_conflicts(base, ours, theirs, ours_matching, theirs_matching) + \
+        _find_link_conflicts(base, ours, theirs, ours_matching, theirs_matching)
+
+
+def three_way_diff(base: Workflow, ours: Workflow, theirs: Workflow, comparers: list[Comparer]) \
+        -> tuple[list[Diff], list[Diff], list[DiffConflict]]:
+    """Runs comparers on base -> ours and base -> theirs and finds conflicts between them."""
+
+    with profiler.stage('matching'):
+        ours_matching, theirs_matching = match_three_way(base, ours, theirs)
+
+    ours_diffs = []
+    theirs_diffs = []
+    for comparer in comparers:
+        with profiler.stage(f'comparer:{comparer.name}'):
+            ours_diffs += comparer.compare(base, ours, ours_matching)
+            theirs_diffs += comparer.compare(base, theirs, theirs_matching)
+
+    with profiler.stage('conflicts'):
+        conflicts = find_conflicts(base, ours, theirs, ours_matching, theirs_matching)
+    logger.info(f'There are {len(conflicts)} conflicts.')
+
+    return ours_diffs, theirs_diffs, conflicts
+
+
+def print_three_way(ours_diffs: list[Diff], theirs_diffs: list[Diff], conflicts: list[DiffConflict]):
+    """Prints changes of both sides and conflicts between them."""
+
+    print('Changes in ours:')
+    print_diffs(ours_diffs)
+
+    print('\nChanges in theirs:')
+    print_diffs(theirs_diffs)
+
+    if conflicts:
+        print('\nConflicts:')
+        for conflict in sorted(conflicts, key=lambda res: res.block_path):
+            print(conflict)
+    else:
+        print('\nNo conflicts!')
@@ -0,0 +1,289 @@
+import json
+import os
+import sqlite3
+import tempfile
+import logging
+from collections import OrderedDict
+from typing import Iterator
+
+from blocks import BlockSettings, create_block
+from context import Context, protoblocks
+from diffs import (Diff, DiffAdd, DiffDel, DiffEditDiscr, DiffEditName, DiffEditPortAdd, DiffEditPortDel,
+                   DiffEditPortFlagB, DiffEditPortFlagP, DiffEditPortFlagR, DiffEditPortName, DiffEditPos,
+                   DiffEditSettings, DiffLinkAdd, DiffLinkDel, render)
+from errors import WorkflowError
+from json_stream import JsonArrayStream
+from profiling import profiler
+from registry import get_comparers
+from sources import Location, open_text
+from workflow import check_keys, create_link
+
+logger = logging.getLogger(f'log.{__name__}')
+
+SIDES = ('old', 'new')
+BATCH_SIZE = 10000
+# Paths of this many Blocks are memoized per workflow, enough for the parents of the Blocks being reported.
+PATH_CACHE_SIZE = 65536
+
+# Rows are numbered in the file order, so scans by rowid give the order of the in-memory comparers.
+SCHEMA = '''
+CREATE TABLE {side}_blocks (number INTEGER PRIMARY KEY, guid TEXT NOT NULL, type TEXT, name TEXT, parent TEXT,
+                            position TEXT, description TEXT, memory, cpu, timeout, protoblock_id TEXT,
+                            protoblock_version INTEGER);
+CREATE TABLE {side}_ports (number INTEGER PRIMARY KEY, guid TEXT NOT NULL, block TEXT NOT NULL, type TEXT, name TEXT,
+                           flag_p INTEGER, flag_b INTEGER, flag_r INTEGER);
+CREATE TABLE {side}_links (number INTEGER PRIMARY KEY, guid TEXT NOT NULL, src TEXT, dst TEXT);
+'''
+
+# Indexes are built after loading, which is faster than keeping them up to date on every insert.
+INDEXES = '''
+CREATE UNIQUE INDEX {side}_blocks_guid ON {side}_blocks (guid);
+CREATE INDEX {side}_ports_guid ON {side}_ports (guid, block);
+CREATE UNIQUE INDEX {side}_links_guid ON {side}_links (guid);
+'''
+
+
+class WorkflowDatabase:
+    """Two workflows in a temporary SQLite database. Only a batch of rows and the memoized paths are in memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # The database is thrown away after the run, so there is nothing to protect by a journal.
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        for side in SIDES:
+            self.connection.executescript(SCHEMA.format(side=side))
+
+        self._paths = {side: OrderedDict() for side in SIDES}
+
+    def load(self, side: str, path: Location):
+        """Streams Blocks, Ports and Links of workflow.json into the tables of the side."""
+
+        blocks, ports, links = [], [], []
+        try:
+            with open_text(path) as fh:
+                stream = JsonArrayStream(fh)
+                for key, item in stream.items({'blocks', 'links'}):
+                    if key == 'blocks':
+                        self._add_block(item, blocks, ports)
+                    else:
+                        link = create_link(item)
+                        links.append((link.guid, link.src, link.dst))
+
+                    if len(blocks) + len(ports) + len(links) >= BATCH_SIZE:
+                        self._insert(side, blocks, ports, links)
+        except FileNotFoundError as ex:
+            raise WorkflowError(str(ex)) from ex
+
+        check_keys(stream.keys)
+
+        self._insert(side, blocks, ports, links)
+        self.connection.executescript(INDEXES.format(side=side))
+        self.connection.commit()
+
+    @staticmethod
+    def _add_block(item: dict, blocks: list[tuple], ports: list[tuple]):
+        block = create_block(item)
+        blocks.append((block.guid, block.type, block.name, block.parent, json.dumps(block.position),
+                       block.description, block.settings.memory, block.settings.cpu, block.settings.timeout,
+                       getattr(block, 'protoblock_id', None), getattr(block, 'protoblock_version', None)))
+        ports.extend((port.guid, block.guid, port.type, port.name, port.flag_p, port.flag_b, port.flag_r)
+                     for port in block.ports)
+
+    def _insert(self, side: str, blocks: list[tuple], ports: list[tuple], links: list[tuple]):
+        execute = self.connection.executemany
+        execute(f'INSERT INTO {side}_blocks (guid, type, name, parent, position, description, memory, cpu, timeout, '
+                f'protoblock_id, protoblock_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', blocks)
+        execute(f'INSERT INTO {side}_ports (guid, block, type, name, flag_p, flag_b, flag_r) '
+                f'VALUES (?, ?, ?, ?, ?, ?, ?)', ports)
+        execute(f'INSERT INTO {side}_links (guid, src, dst) VALUES (?, ?, ?)', links)
+        blocks.clear()
+        ports.clear()
+        links.clear()
+
+    def get_path(self, side: str, guid: str) -> str:
+        """Returns a path of the Block parents, like WorkflowIndex.get_path does.
+
+        Parents are walked up in a loop until a memoized (or root) ancestor, so nesting of any depth is fine.
+        The last PATH_CACHE_SIZE paths are memoized.
+        """
+
+        paths = self._paths[side]
+        chain = {}
+        path = None
+        while guid is not None:
+            path = paths.get(guid)
+            if path is not None:
+                paths.move_to_end(guid)
+                break
+
+            # A cycle of parents, or a parent out of the workflow, ends the path.
+            if guid in chain:
+                break
+            row = self.connection.execute(f'SELECT name, parent, type, protoblock_id, protoblock_version '
+                                          f'FROM {side}_blocks WHERE guid = ?', (guid,)).fetchone()
+            if row is None:
+                break
+            name, parent, block_type, protoblock_id, protoblock_version = row
+            chain[guid] = _get_title(name, block_type, protoblock_id, protoblock_version)
+            guid = parent
+
+        for ancestor, title in reversed(chain.items()):
+            path = title if path is None else f'{path} / {title}'
+            paths[ancestor] = path
+        while len(paths) > PATH_CACHE_SIZE:
+            paths.popitem(last=False)
+
+        return path
+
+    def close(self):
+        self.connection.close()
+        os.unlink(self.path)
+
+
+def _get_title(name: str, block_type: str, protoblock_id: str | None, protoblock_version: int | None) -> str:
+    if block_type == 'BLOCK':
+        protoblock_name = protoblocks.get(protoblock_id, protoblock_version)
+        if protoblock_name is not None and protoblock_name != name:
+            return f'{name} ({protoblock_name})'
+
+    return name
+
+
+def compare_blocks(database: WorkflowDatabase) -> Iterator[Diff]:
+    """Deleted Blocks in the old file order, then added Blocks in the new file order."""
+
+    for side, other, diff_class in (('old', 'new', DiffDel), ('new', 'old', DiffAdd)):
+        for guid, in database.connection.execute(f'SELECT b.guid FROM {side}_blocks b '
+                                                 f'WHERE NOT EXISTS (SELECT 1 FROM {other}_blocks o '
+                                                 f'WHERE o.guid = b.guid) ORDER BY b.number'):
+            yield diff_class(database.get_path(side, guid), guid)
+
+
+def compare_block_edits(database: WorkflowDatabase) -> Iterator[Diff]:
+    """Edited fields of the Blocks in both workflows, in the old file order."""
+
+    rows = database.connection.execute(
+        'SELECT o.guid, o.name, n.name, o.position, n.position, o.description, n.description, '
+        'o.memory, o.cpu, o.timeout, n.memory, n.cpu, n.timeout '
+        'FROM old_blocks o JOIN new_blocks n ON n.guid = o.guid '
+        'WHERE o.name IS NOT n.name OR o.position IS NOT n.position OR o.description IS NOT n.description '
+        'OR o.memory IS NOT n.memory OR o.cpu IS NOT n.cpu OR o.timeout IS NOT n.timeout '
+        'ORDER BY o.number')
+
+    for guid, old_name, new_name, old_position, new_position, old_description, new_description, *settings in rows:
+        if old_name != new_name:
+            yield DiffEditName(database.get_path('old', guid), guid, old_name, new_name)
+
+        path = database.get_path('new', guid)
+        if old_position != new_position:
+            yield DiffEditPos(path, guid, tuple(json.loads(old_position)), tuple(json.loads(new_position)))
+        if old_description != new_description:
+            yield DiffEditDiscr(path, guid, old_description, new_description)
+        if settings[:3] != settings[3:]:
+            yield DiffEditSettings(path, guid, BlockSettings(*settings[:3]), BlockSettings(*settings[3:]))
+
+
+def _get_port_title(name: str, port_type: str) -> str:
+    return f'{name} ({port_type})'
+
+
+def compare_links(database: WorkflowDatabase) -> Iterator[Diff]:
+    """Deleted Links in the old file order, then added Links in the new file order."""
+
+    for side, other, diff_class in (('old', 'new', DiffLinkDel), ('new', 'old', DiffLinkAdd)):
+        rows = database.connection.execute(
+            f'SELECT l.guid, l.src, l.dst, s.block, s.name, s.type, d.block, d.name, d.type FROM {side}_links l '
+            f'LEFT JOIN {side}_ports s ON s.guid = l.src LEFT JOIN {side}_ports d ON d.guid = l.dst '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {other}_links o WHERE o.guid = l.guid) ORDER BY l.number')
+
+        for guid, src, dst, src_block, src_name, src_type, dst_block, dst_name, dst_type in rows:
+            if src_block is None or dst_block is None:
+                logger.warning(f'Link {guid} refers to a missing port.')
+                continue
+
+            yield diff_class(database.get_path(side, src_block), guid, _get_port_title(src_name, src_type),
+                             database.get_path(side, dst_block), _get_port_title(dst_name, dst_type), src, dst)
+
+
+def compare_ports(database: WorkflowDatabase) -> Iterator[Diff]:
+    """Deleted, then added Ports of the Blocks in both workflows, by the old order of the Blocks."""
+
+    deleted = database.connection.execute(
+        'SELECT o.block, o.guid, o.name, o.type FROM old_ports o JOIN new_blocks b ON b.guid = o.block '
+        'WHERE NOT EXISTS (SELECT 1 FROM new_ports n WHERE n.guid = o.guid AND n.block = o.block) '
+        'ORDER BY o.number')
+    for block, guid, name, port_type in deleted:
+        yield DiffEditPortDel(database.get_path('new', block), block, _get_port_title(name, port_type), guid)
+
+    added = database.connection.execute(
+        'SELECT n.block, n.guid, n.name, n.type FROM new_ports n JOIN old_blocks b ON b.guid = n.block '
+        'WHERE NOT EXISTS (SELECT 1 FROM old_ports o WHERE o.guid = n.guid AND o.block = n.block) '
+        'ORDER BY b.number, n.number')
+    for block, guid, name, port_type in added:
+        yield DiffEditPortAdd(database.get_path('new', block), block, _get_port_title(name, port_type), guid)
+
+
+def compare_port_edits(database: WorkflowDatabase) -> Iterator[Diff]:
+    """Edited names and flags of the Ports in both workflows, in the old file order."""
+
+    rows = database.connection.execute(
+        'SELECT n.block, n.guid, o.name, o.type, n.name, o.flag_p, n.flag_p, o.flag_b, n.flag_b, o.flag_r, n.flag_r '
+        'FROM old_ports o JOIN new_ports n ON n.guid = o.guid AND n.block = o.block '
+        'WHERE o.name IS NOT n.name OR o.flag_p IS NOT n.flag_p OR o.flag_b IS NOT n.flag_b '
+        'OR o.flag_r IS NOT n.flag_r ORDER BY o.number')
+
+    for block, guid, old_name, port_type, new_name, *flags in rows:
+        path = database.get_path('new', block)
+        title = _get_port_title(old_name, port_type)
+        old_p, new_p, old_b, new_b, old_r, new_r = (None if flag is None else bool(flag) for flag in flags)
+
+        if old_name != new_name:
+            yield DiffEditPortName(path, block, title, guid, old_name, new_name)
+        if old_p != new_p:
+            yield DiffEditPortFlagP(path, block, title, guid, old_p, new_p)
+        if old_b != new_b:
+            yield DiffEditPortFlagB(path, block, title, guid, old_b, new_b)
+        if old_r != new_r:
+            yield DiffEditPortFlagR(path, block, title, guid, old_r, new_r)
+
+
+# Built-in comparers done as queries. Plugins need the Workflow models, so they cannot run in this mode.
+COMPARERS = {
+    'blocks': compare_blocks,
+    'block_edits': compare_block_edits,
+    'links': compare_links,
+    'ports': compare_ports,
+    'port_edits': compare_port_edits,
+}
+
+
+def iter_diffs(database: WorkflowDatabase, names: list[str]) -> Iterator[Diff]:
+    for name in names:
+        yield from profiler.iterate(f'comparer:{name}', COMPARERS[name](database))
+
+
+def diff_out_of_core(context: Context, renderer):
+    """Diffs two workflows of any size through a temporary SQLite database next to the system temporary files."""
+
+    names = []
+    for comparer in get_comparers(context.only, context.skip):
+        if comparer.name in COMPARERS:
+            names.append(comparer.name)
+        else:
+            logger.warning(f'Comparer "{comparer.name}" cannot run in the out-of-core mode and is skipped.')
+
+    context.load_protoblocks()
+    fd, path = tempfile.mkstemp(suffix='.sqlite', prefix='workflow-diff-')
+    os.close(fd)
+    database = WorkflowDatabase(path)
+    try:
+        with profiler.stage('load'):
+            database.load('old', context.first_path_to_workflow)
+            database.load('new', context.second_path_to_workflow)
+
+        with profiler.stage('render'):
+            render(iter_diffs(database, names), renderer)
+    finally:
+        database.close()
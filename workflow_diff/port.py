@@ -1,31 +1,172 @@
-from dataclasses import dataclass, field
+import sys
+from array import array
+from typing import Iterator
+
+# Every flag takes two bits: 0 - not set (None), 1 - False, 2 - True.
+FLAG_VALUES = (None, False, True)
+FLAG_P = 0
+FLAG_B = 2
+FLAG_R = 4
+
+
+def intern_optional(value: str | None) -> str | None:
+    """Interns a string, other values like None are returned as is."""
+
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _pack_flag(value: bool | None, shift: int) -> int:
+    return (0 if value is None else 2 if value else 1) << shift
+
+
+def _unpack_flag(flags: int, shift: int) -> bool | None:
+    return FLAG_VALUES[(flags >> shift) & 3]
+
+
+class PortTable:
+    """Column-oriented storage of all Ports of a workflow. Strings are interned and flags are packed into a byte."""
+
+    __slots__ = ('types', 'guids', 'names', 'flags')
+
+    def __init__(self):
+        self.types = []
+        self.guids = []
+        self.names = []
+        self.flags = array('B')
+
+    def append(self, dictionary: dict) -> int:
+        """Adds a Port from the dictionary and returns its row."""
+
+        self.types.append(intern_optional(dictionary['type']))
+        self.guids.append(intern_optional(dictionary['guid']))
+        self.names.append(intern_optional(dictionary['name']))
+        self.flags.append(_pack_flag(dictionary.get('parameter'), FLAG_P) |
+                          _pack_flag(dictionary.get('batch'), FLAG_B) |
+                          _pack_flag(dictionary.get('history', {}).get('enabled'), FLAG_R))
+
+        return len(self.guids) - 1
+
+    def __len__(self) -> int:
+        return len(self.guids)
 
 
-@dataclass(slots=True, unsafe_hash=True)
 class Port:
-    """Class of port for Block."""
+    """Class of port for Block. It is a view of a row of PortTable, compared by guid."""
+
+    __slots__ = ('_table', '_row')
 
-    type: str = field(compare=False)
-    guid: str = field(compare=True)
-    name: str = field(compare=False)
-    flag_p: bool = field(compare=False)
-    flag_b: bool = field(compare=False)
-    flag_r: bool = field(compare=False)
+    def __init__(self, table: PortTable, row: int):
+        self._table = table
+        self._row = row
 
     @classmethod
-    def from_dict(cls, dictionary: dict):
-        """Creating an object of Port from the dictionary."""
-
-        return cls(
-            type=dictionary['type'],
-            guid=dictionary['guid'],
-            name=dictionary['name'],
-            flag_p=dictionary.get('parameter'),
-            flag_b=dictionary.get('batch'),
-            flag_r=dictionary.get('history', {}).get('enabled')
-        )
+    def from_dict(cls, dictionary: dict, table: PortTable | None = None):
+        """Creating an object of Port from the dictionary. The Port is stored in the table."""
+
+        if table is None:
+            table = PortTable()
+
+        return cls(table, table.append(dictionary))
+
+    @property
+    def type(self) -> str:
+        return self._table.types[self._row]
+
+    @property
+    def guid(self) -> str:
+        return self._table.guids[self._row]
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._row]
+
+    @property
+    def flag_p(self) -> bool | None:
+        return _unpack_flag(self._table.flags[self._row], FLAG_P)
+
+    @property
+    def flag_b(self) -> bool | None:
+        return _unpack_flag(self._table.flags[self._row], FLAG_B)
+
+    @property
+    def flag_r(self) -> bool | None:
+        return _unpack_flag(self._table.flags[self._row], FLAG_R)
 
     def get_title(self) -> str:
         """Returns briefly block description."""
 
         return f"{self.name} ({self.type})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Port):
+            return NotImplemented
+
+        return self.guid == other.guid
+
+    def __hash__(self) -> int:
+        return hash((self.guid,))
+
+    def __repr__(self) -> str:
+        return f'Port(type={self.type!r}, guid={self.guid!r}, name={self.name!r}, ' \
+               f'flag_p={self.flag_p!r}, flag_b={self.flag_b!r}, flag_r={self.flag_r!r})'
+
+
+class PortSlice:
+    """Ports of one Block: a contiguous range of rows of PortTable. Behaves like a tuple of Ports."""
+
+    __slots__ = ('_table', '_start', '_stop')
+
+    def __init__(self, table: PortTable, start: int, stop: int):
+        self._table = table
+        self._start = start
+        self._stop = stop
+
+    @classmethod
+    def from_list(cls, ports: list[dict], table: PortTable | None = None):
+        """Stores Ports from the list of dictionaries in the table."""
+
+        if table is None:
+            table = PortTable()
+
+        start = len(table)
+        for port in ports:
+            table.append(port)
+
+        return cls(table, start, len(table))
+
+    def __iter__(self) -> Iterator[Port]:
+        return (Port(self._table, row) for row in range(self._start, self._stop))
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def get_content(self) -> tuple:
+        """Returns all values of the Ports, column by column. Unlike Ports, it is compared by every field."""
+
+        rows = slice(self._start, self._stop)
+        table = self._table
+
+        return tuple(table.types[rows]), tuple(table.guids[rows]), tuple(table.names[rows]), table.flags[rows].tobytes()
+
+    def get_guids(self, port_type: str) -> list[str]:
+        """Returns guids of the Ports of the type, without creating the Ports."""
+
+        rows = slice(self._start, self._stop)
+        table = self._table
+
+        return [guid for guid, type_ in zip(table.guids[rows], table.types[rows]) if type_ == port_type]
+
+    def __getitem__(self, item: int) -> Port:
+        return Port(self._table, range(self._start, self._stop)[item])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PortSlice):
+            return NotImplemented
+
+        return tuple(self) == tuple(other)
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
@@ -0,0 +1,206 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import logging
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Iterator, IO
+
+logger = logging.getLogger(f'log.{__name__}')
+
+
+@dataclass(slots=True)
+class StageStats:
+    """Totals of a stage over all its calls. Times and allocations are inclusive of the nested stages."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    self_seconds: float = 0.0
+    allocated: int = 0
+    peak: int = 0
+
+
+@dataclass(slots=True)
+class _Frame:
+    name: str
+    start: float
+    memory: int
+    children_seconds: float = 0.0
+    peak: int = 0
+
+
+class Profiler:
+    """Records wall time, calls and traced memory of the pipeline stages. It does nothing until it is enabled.
+
+    Memory is recorded only while tracemalloc is tracing: the growth of traced memory and its peak during a stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.events = None
+        # Every thread has its own stack of stages, the stats are shared.
+        self._local = threading.local()
+        self._origin = 0.0
+
+    def enable(self, trace_events: bool = False):
+        """Starts recording. With trace_events every call of a stage is kept for a Chrome trace."""
+
+        self.enabled = True
+        self.stats = {}
+        self.events = [] if trace_events else None
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name: str, count: bool = True):
+        """Returns a context manager which records the stage. count=False continues the last call of the stage."""
+
+        if not self.enabled:
+            return nullcontext()
+
+        return self._record(name, count)
+
+    @property
+    def _stack(self) -> list[_Frame]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    @contextmanager
+    def _record(self, name: str, count: bool):
+        stack = self._stack
+        tracing = tracemalloc.is_tracing()
+        memory = 0
+        if tracing:
+            memory, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+
+        frame = _Frame(name, time.perf_counter(), memory)
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - frame.start
+            stack.pop()
+
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = StageStats()
+            stats.calls += count
+            stats.seconds += elapsed
+            stats.self_seconds += elapsed - frame.children_seconds
+
+            allocated = 0
+            if tracing:
+                memory, peak = tracemalloc.get_traced_memory()
+                allocated = memory - frame.memory
+                stats.allocated += allocated
+                stats.peak = max(stats.peak, frame.peak, peak)
+
+            if stack:
+                parent = stack[-1]
+                parent.children_seconds += elapsed
+                if tracing:
+                    parent.peak = max(parent.peak, frame.peak, peak)
+
+            if self.events is not None:
+                self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                                    'ts': (frame.start - self._origin) * 1e6, 'dur': elapsed * 1e6,
+                                    'args': {'allocated': allocated}})
+
+    def iterate(self, name: str, iterator: Iterator) -> Iterator:
+        """Yields from the iterator and records only the time spent inside it, as one call of the stage."""
+
+        if not self.enabled:
+            yield from iterator
+            return
+
+        iterator = iter(iterator)
+        first = True
+        while True:
+            with self.stage(name, count=first):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            first = False
+            yield item
+
+    def instrument(self, owner, attribute: str, name: str):
+        """Replaces the function owner.attribute by a wrapper which records every call as the stage."""
+
+        function = getattr(owner, attribute)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        setattr(owner, attribute, wrapper)
+
+    def format_table(self) -> str:
+        """Returns a table of the stages sorted by the inclusive time."""
+
+        header = f'{"Stage":<32}{"Calls":>9}{"Time, s":>10}{"Self, s":>10}{"Alloc, MiB":>12}{"Peak, MiB":>11}'
+        lines = [header, '-' * len(header)]
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].seconds):
+            lines.append(f'{name:<32}{stats.calls:>9}{stats.seconds:>10.3f}{stats.self_seconds:>10.3f}'
+                         f'{stats.allocated / 2 ** 20:>12.1f}{stats.peak / 2 ** 20:>11.1f}')
+
+        return '\n'.join(lines)
+
+    def write_trace(self, file: IO[str]):
+        """Writes the recorded calls in the Chrome trace event format, for chrome://tracing or Perfetto."""
+
+        json.dump({'traceEvents': self.events or [], 'displayTimeUnit': 'ms'}, file)
+
+
+profiler = Profiler()
+
+
+@contextmanager
+def profile_run(output_path: str | None = None, trace_memory: bool = True):
+    """Profiles the code in the block and prints the table of stages to stderr.
+
+    The output_path ending with .json gets a Chrome trace, any other path gets cProfile stats for pstats.
+    """
+
+    import cProfile
+
+    trace_events = output_path is not None and output_path.endswith('.json')
+    python_profile = cProfile.Profile() if output_path is not None and not trace_events else None
+
+    if trace_memory:
+        tracemalloc.start()
+    profiler.enable(trace_events=trace_events)
+    if python_profile is not None:
+        python_profile.enable()
+
+    try:
+        with profiler.stage('total'):
+            yield profiler
+    finally:
+        if python_profile is not None:
+            python_profile.disable()
+            python_profile.dump_stats(output_path)
+        profiler.disable()
+        if trace_memory:
+            tracemalloc.stop()
+
+        if trace_events:
+            with open(output_path, 'w', encoding='utf-8') as fh:
+                profiler.write_trace(fh)
+
+        print(profiler.format_table(), file=sys.stderr)
+        if output_path is not None:
+            print(f'Profile has been written to {output_path}', file=sys.stderr)
@@ -0,0 +1,127 @@
+import importlib
+import os
+import pkgutil
+import sys
+import logging
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from errors import WorkflowError
+
+logger = logging.getLogger(f'log.{__name__}')
+
+ENTRY_POINT_GROUP = 'workflow_diff.comparers'
+COMPARERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'comparers')
+
+# Shared data which is built only if a selected comparer needs it. The Workflow index is always built lazily.
+MATCHING = 'matching'
+
+
+@dataclass(slots=True, frozen=True)
+class Comparer:
+    """A registered comparer: compare(old_workflow, new_workflow, matching) yields Diffs.
+
+    Comparers run in the order of (order, name). If no selected comparer needs the matching, an empty one is passed.
+    A shardable comparer yields Diffs only while iterating the lists of the matching, so it can run on shards of them.
+    """
+
+    name: str
+    compare: Callable
+    needs: frozenset[str]
+    order: int
+    shardable: bool = False
+
+
+_comparers = {}
+_loaded = False
+
+
+def register(name: str, needs: Iterable[str] = (MATCHING,), order: int = 100, shardable: bool = False):
+    """Registers the decorated compare function under the name."""
+
+    def decorator(compare: Callable) -> Callable:
+        if name in _comparers and _comparers[name].compare is not compare:
+            logger.warning(f'Comparer "{name}" has been registered again by {compare.__module__}.')
+        _comparers[name] = Comparer(name, compare, frozenset(needs), order, shardable)
+        return compare
+
+    return decorator
+
+
+def _has_entry_points() -> bool:
+    """Returns True if an installed distribution may declare comparers.
+
+    It only looks for the group in entry_points.txt files, because importing importlib.metadata takes longer
+    than a whole short diff.
+    """
+
+    marker = f'[{ENTRY_POINT_GROUP}]'
+    for path in sys.path:
+        try:
+            entries = os.scandir(path or '.')
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith(('.dist-info', '.egg-info')):
+                    continue
+                try:
+                    with open(os.path.join(entry.path, 'entry_points.txt'), 'r', encoding='utf-8') as fh:
+                        if marker in fh.read():
+                            return True
+                except OSError:
+                    continue
+
+    return False
+
+
+def load_comparers():
+    """Imports the built-in comparers and the ones installed with the workflow_diff.comparers entry point.
+
+    An entry point may refer to a module which registers its comparers, or to a compare function itself.
+    """
+
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    for module in pkgutil.iter_modules([COMPARERS_PATH]):
+        importlib.import_module(f'comparers.{module.name}')
+
+    if not _has_entry_points():
+        return
+
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            loaded = entry_point.load()
+        except Exception as ex:
+            logger.warning(f'Comparer "{entry_point.name}" cannot be loaded: {ex}')
+            continue
+
+        if callable(loaded) and all(comparer.compare is not loaded for comparer in _comparers.values()):
+            register(entry_point.name)(loaded)
+
+
+def get_comparers(only: Iterable[str] | None = None, skip: Iterable[str] = ()) -> list[Comparer]:
+    """Returns the registered comparers in their order. only selects some of them, skip excludes some of them."""
+
+    load_comparers()
+
+    for name in (*(only or ()), *skip):
+        if name not in _comparers:
+            raise WorkflowError(f'There is no comparer "{name}". Comparers: {", ".join(sorted(_comparers))}')
+
+    selected = [comparer for comparer in _comparers.values()
+                if (only is None or comparer.name in only) and comparer.name not in skip]
+
+    return sorted(selected, key=lambda comparer: (comparer.order, comparer.name))
+
+
+def is_needed(comparers: list[Comparer], data: str) -> bool:
+    """Returns True if any of the comparers needs the shared data."""
+
+    return any(data in comparer.needs for comparer in comparers)
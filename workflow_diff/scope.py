@@ -0,0 +1,95 @@
+from typing import Iterable
+from errors import WorkflowError
+from link import Link
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+PATH_SEPARATOR = ' / '
+
+# A light description of a Block from workflow.json: guid, parent guid, name and guids of its ports.
+Skeleton = tuple[str, str | None, str, tuple[str, ...]]
+
+
+def get_skeleton(dictionary: dict) -> Skeleton:
+    """Returns the skeleton of the Block dictionary, enough to find a scope without creating the Block."""
+
+    return dictionary['guid'], dictionary['parent'], dictionary['name'], \
+        tuple(port['guid'] for port in dictionary['ports'])
+
+
+def _is_title_of(segment: str, name: str) -> bool:
+    """Returns True if the path segment is the name, with or without the protoblock name in brackets."""
+
+    return segment == name or (segment.startswith(f'{name} (') and segment.endswith(')'))
+
+
+def find_scope_root(skeletons: list[Skeleton], scope: str) -> str | None:
+    """Finds a guid of the Block by its guid or by a path like the ones Block.get_path returns."""
+
+    guids = {guid for guid, *_ in skeletons}
+    if scope in guids:
+        return scope
+
+    children = {}
+    for guid, parent, name, _ in skeletons:
+        children.setdefault(parent if parent in guids else None, []).append((guid, name))
+
+    found = [None]
+    for segment in scope.split(PATH_SEPARATOR):
+        found = [guid for parent in found for guid, name in children.get(parent, []) if _is_title_of(segment, name)]
+
+    if len(found) > 1:
+        raise WorkflowError(f'Scope "{scope}" is ambiguous, use a guid of one of the blocks: {", ".join(found)}')
+
+    return found[0] if found else None
+
+
+def select_scope(skeletons: list[Skeleton], links: Iterable[Link], scope: str) -> tuple[set[str], set[str], list[Link]]:
+    """Returns guids of the scoped Blocks, guids of the context Blocks and the Links touching the scoped Blocks.
+
+    The scope is the Block found by find_scope_root with all its descendants. Context Blocks are its ancestors and
+    Blocks at the other ends of the Links with their ancestors. They are needed only to print paths.
+    """
+
+    root = find_scope_root(skeletons, scope)
+    if root is None:
+        logger.warning(f'There is no block "{scope}" in the workflow.')
+        return set(), set(), []
+
+    parents = {}
+    children = {}
+    port_owners = {}
+    for guid, parent, _, port_guids in skeletons:
+        parents[guid] = parent
+        children.setdefault(parent, []).append(guid)
+        for port_guid in port_guids:
+            port_owners[port_guid] = guid
+
+    scoped = set()
+    stack = [root]
+    while stack:
+        guid = stack.pop()
+        scoped.add(guid)
+        stack.extend(children.get(guid, []))
+
+    scoped_links = []
+    outside = {root}
+    for link in links:
+        src_owner = port_owners.get(link.src)
+        dst_owner = port_owners.get(link.dst)
+        if src_owner in scoped or dst_owner in scoped:
+            scoped_links.append(link)
+            outside.update(owner for owner in (src_owner, dst_owner) if owner is not None and owner not in scoped)
+
+    context = set()
+    for guid in outside:
+        guid = parents.get(guid)
+        while guid in parents and guid not in context:
+            context.add(guid)
+            guid = parents[guid]
+    context |= outside - {root}
+
+    logger.info(f'Scope "{scope}" consists of {len(scoped)} blocks and {len(scoped_links)} links.')
+
+    return scoped, context, scoped_links
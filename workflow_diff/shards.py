@@ -0,0 +1,162 @@
+import heapq
+import multiprocessing
+import zlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from operator import itemgetter
+from typing import Iterator
+
+from context import protoblocks
+from diffs import Diff
+from matching import Matching
+from profiling import profiler
+from registry import Comparer
+from sources import forget_handles
+from workflow import Workflow
+
+logger = logging.getLogger(f'log.{__name__}')
+
+# Smaller shards cost more to fork and to send back than to compare.
+MIN_SHARD_SIZE = 500
+
+
+class _Tracker:
+    """The item a comparer is handling: the rank of its Matching list and its index in the whole list."""
+
+    __slots__ = ('position', 'sections')
+
+    def __init__(self):
+        self.position = (-1, -1)
+        self.sections = {}
+
+
+class _ShardList(list):
+    """Items of a Matching list which belong to one shard. Iterating it moves the tracker to the current item."""
+
+    __slots__ = ('name', 'positions', 'tracker')
+
+    def __init__(self, items: list, name: str, positions: list[int], tracker: _Tracker):
+        super().__init__(items)
+        self.name = name
+        self.positions = positions
+        self.tracker = tracker
+
+    def __iter__(self):
+        tracker = self.tracker
+        section = tracker.sections.setdefault(self.name, len(tracker.sections))
+        for position, item in zip(self.positions, super().__iter__()):
+            tracker.position = (section, position)
+            yield item
+
+
+def get_shard_index(item, count: int) -> int:
+    """Returns the shard of a Matching item by the crc32 of its Block guid, so Ports stay with their Block."""
+
+    block = item[0] if isinstance(item, tuple) else item
+    return zlib.crc32(block.guid.encode('utf-8')) % count
+
+
+def split_matching(matching: Matching, count: int) -> list[dict[str, tuple[list, list[int]]]]:
+    """Splits every list of the Matching into shards. Items of a shard are kept with their indices in the list."""
+
+    shards = [{} for _ in range(count)]
+    for field in fields(Matching):
+        items = getattr(matching, field.name)
+        if not isinstance(items, list):
+            continue
+
+        for shard in shards:
+            shard[field.name] = ([], [])
+        for position, item in enumerate(items):
+            shard_items, positions = shards[get_shard_index(item, count)][field.name]
+            shard_items.append(item)
+            positions.append(position)
+
+    return shards
+
+
+def get_shard_count(matching: Matching, comparers: list[Comparer], jobs: int) -> int:
+    """Returns the number of shards worth running in parallel, 1 if the comparers should run serially."""
+
+    if not any(comparer.shardable for comparer in comparers):
+        return 1
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # Workers get the Workflows by fork, pickling them would cost more than comparing.
+        logger.warning('Comparers run serially, because processes cannot be forked on this platform.')
+        return 1
+
+    size = sum(len(items) for items in (getattr(matching, field.name) for field in fields(Matching))
+               if isinstance(items, list))
+
+    return max(min(jobs, size // MIN_SHARD_SIZE), 1)
+
+
+_state = None
+
+
+def _init_worker(old_workflow: Workflow, new_workflow: Workflow, matching: Matching, comparers: list[Comparer],
+                 shards: list[dict]):
+    """Keeps the state of the forked worker. Handles of the parent are not shared, titles of Protoblocks may still
+    be read from git objects, archives and the on-disk cache."""
+
+    global _state
+    _state = old_workflow, new_workflow, matching, comparers, shards
+    forget_handles()
+    protoblocks.forget_cache()
+
+
+def _run_shard(index: int) -> dict[str, list[tuple[tuple[int, int, int], Diff]]]:
+    """Runs the shardable comparers on the shard and returns their Diffs with the keys of their order."""
+
+    old_workflow, new_workflow, matching, comparers, shards = _state
+
+    results = {}
+    for comparer in comparers:
+        tracker = _Tracker()
+        lists = {name: _ShardList(items, name, positions, tracker)
+                 for name, (items, positions) in shards[index].items()}
+        shard_matching = Matching(**{field.name: lists.get(field.name, getattr(matching, field.name))
+                                     for field in fields(Matching)})
+
+        results[comparer.name] = [((*tracker.position, number), diff) for number, diff
+                                  in enumerate(comparer.compare(old_workflow, new_workflow, shard_matching))]
+
+    return results
+
+
+def iter_sharded_diffs(old_workflow: Workflow, new_workflow: Workflow, comparers: list[Comparer],
+                       matching: Matching, count: int) -> Iterator[Diff]:
+    """Yields Diffs of all comparers in the same order as running them serially.
+
+    Shardable comparers run on count shards of the Matching in forked processes. Diffs of every shard are ordered
+    by the index of the Matching item they came from, so merging the shards restores the serial order.
+    Other comparers run in this process meanwhile.
+    """
+
+    sharded = [comparer for comparer in comparers if comparer.shardable]
+    shards = split_matching(matching, count)
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=count, mp_context=context, initializer=_init_worker,
+                             initargs=(old_workflow, new_workflow, matching, sharded, shards)) as executor:
+        futures = [executor.submit(_run_shard, index) for index in range(count)]
+
+        serial = {}
+        for comparer in comparers:
+            if not comparer.shardable:
+                serial[comparer.name] = list(profiler.iterate(f'comparer:{comparer.name}',
+                                                              comparer.compare(old_workflow, new_workflow, matching)))
+
+        with profiler.stage('shards'):
+            results = [future.result() for future in futures]
+
+    logger.info(f'Comparers have run on {count} shards.')
+
+    for comparer in comparers:
+        if not comparer.shardable:
+            yield from serial[comparer.name]
+            continue
+
+        for _, diff in heapq.merge(*(result[comparer.name] for result in results), key=itemgetter(0)):
+            yield diff
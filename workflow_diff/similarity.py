@@ -0,0 +1,119 @@
+from blocks import Block
+from matching import Matching
+from workflow import Workflow
+import logging
+
+logger = logging.getLogger(f'log.{__name__}')
+
+NAME_WEIGHT = 0.4
+THRESHOLD = 0.5
+# Tokens shared by more Blocks than this do not propose candidates (like stop words), they only add to the score.
+MAX_POSTING = 64
+
+
+def get_bucket_key(block: Block) -> tuple:
+    """Returns a key of the Blocks which can be the same Block recreated: the type, protoblock and Ports signature."""
+
+    signature = tuple(sorted((port.type, port.name) for port in block.ports))
+    return type(block).__name__, block.type, getattr(block, 'protoblock_id', None), signature
+
+
+def get_neighbourhood(workflow: Workflow, block: Block, aliases: dict[str, str]) -> frozenset:
+    """Returns tokens of the Block neighbourhood: its parent and Blocks linked to it.
+
+    Guids of the first workflow are translated by aliases of the Blocks which have already been matched.
+    """
+
+    tokens = {('parent', aliases.get(block.parent, block.parent))}
+    for port in block.ports:
+        for link in workflow.links.from_port(port.guid):
+            other = workflow.index.find_port(link.dst)
+            if other is not None:
+                tokens.add(('dst', aliases.get(other[0].guid, other[0].guid)))
+        for link in workflow.links.to_port(port.guid):
+            other = workflow.index.find_port(link.src)
+            if other is not None:
+                tokens.add(('src', aliases.get(other[0].guid, other[0].guid)))
+
+    return frozenset(tokens)
+
+
+def _get_score(old_block: Block, new_block: Block, old_tokens: frozenset, new_tokens: frozenset) -> float:
+    jaccard = len(old_tokens & new_tokens) / len(old_tokens | new_tokens)
+    return NAME_WEIGHT * (old_block.name == new_block.name) + (1 - NAME_WEIGHT) * jaccard
+
+
+def _find_pairs(old_workflow: Workflow, new_workflow: Workflow, deleted: list[Block], added: list[Block],
+                aliases: dict[str, str]) -> list[tuple[Block, Block]]:
+    """Pairs deleted Blocks with similar added Blocks of the same bucket, the best scores first.
+
+    Candidates come from an inverted index of names and neighbourhood tokens, so dissimilar Blocks are never scored.
+    """
+
+    postings = {}
+    new_tokens = {}
+    for block in added:
+        new_tokens[block.guid] = get_neighbourhood(new_workflow, block, {})
+        bucket_key = get_bucket_key(block)
+        for token in (('name', block.name), *new_tokens[block.guid]):
+            postings.setdefault((bucket_key, token), []).append(block)
+
+    scored = []
+    for old_block in deleted:
+        old_tokens = get_neighbourhood(old_workflow, old_block, aliases)
+        bucket_key = get_bucket_key(old_block)
+
+        candidates = {}
+        for token in (('name', old_block.name), *old_tokens):
+            posting = postings.get((bucket_key, token), [])
+            if len(posting) <= MAX_POSTING:
+                candidates.update((block.guid, block) for block in posting)
+
+        for new_block in candidates.values():
+            score = _get_score(old_block, new_block, old_tokens, new_tokens[new_block.guid])
+            if score >= THRESHOLD:
+                scored.append((-score, old_workflow.index.order[old_block.guid],
+                               new_workflow.index.order[new_block.guid], old_block, new_block))
+
+    pairs = []
+    old_matched = set()
+    new_matched = set()
+    for *_, old_block, new_block in sorted(scored, key=lambda item: item[:3]):
+        if old_block.guid not in old_matched and new_block.guid not in new_matched:
+            old_matched.add(old_block.guid)
+            new_matched.add(new_block.guid)
+            pairs.append((old_block, new_block))
+
+    return pairs
+
+
+def match_similar(old_workflow: Workflow, new_workflow: Workflow, matching: Matching):
+    """Pairs deleted and added Blocks which look like the same Block recreated with a new guid.
+
+    Pairs are matched in rounds: a matched Composite makes the neighbourhoods of its children comparable.
+    The pairs are moved from added and deleted Blocks to similar_blocks, and their Ports are recorded as aliases.
+    """
+
+    aliases = {}
+    while matching.deleted_blocks and matching.added_blocks:
+        pairs = _find_pairs(old_workflow, new_workflow, matching.deleted_blocks, matching.added_blocks, aliases)
+        if not pairs:
+            break
+
+        for old_block, new_block in pairs:
+            aliases[old_block.guid] = new_block.guid
+            matching.similar_blocks.append((old_block, new_block))
+            matching.blocks.append((old_block, new_block))
+
+            # Blocks of one bucket have the same Ports signature, so the Ports are paired in the signature order.
+            old_ports = sorted(old_block.ports, key=lambda port: (port.type, port.name))
+            new_ports = sorted(new_block.ports, key=lambda port: (port.type, port.name))
+            for old_port, new_port in zip(old_ports, new_ports):
+                matching.port_aliases[old_port.guid] = new_port.guid
+                matching.ports.append((new_block, old_port, new_port))
+
+        matching.deleted_blocks = [block for block in matching.deleted_blocks if block.guid not in aliases]
+        new_guids = set(aliases.values())
+        matching.added_blocks = [block for block in matching.added_blocks if block.guid not in new_guids]
+
+    logger.info(f'{len(matching.similar_blocks)} blocks have been recreated with a new guid.')
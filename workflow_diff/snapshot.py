@@ -0,0 +1,115 @@
+import os
+import hashlib
+import pickle
+import logging
+
+from cache import get_cache_dir
+from sources import GitObject, Location, get_stamp, open_binary
+from workflow import Workflow
+
+logger = logging.getLogger(f'log.{__name__}')
+
+# Snapshots of another format version are never read, so it must be changed together with the model classes.
+FORMAT_VERSION = b'1'
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+class SnapshotCache:
+    """On-disk cache of parsed Workflows, pickled by the content hash of workflow.json.
+
+    The total size is bounded: the least recently used snapshots are evicted first.
+    """
+
+    def __init__(self, directory: str | None = None, max_size: int = DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = os.path.join(get_cache_dir(), 'snapshots')
+
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(path: Location) -> str:
+        """Returns a key of the workflow file: a hash of its content, so a fresh checkout of the same file hits.
+
+        A git object is not read, its id is a hash of the content already.
+        """
+
+        if isinstance(path, GitObject):
+            digest = hashlib.blake2b(f'git:{get_stamp(path)[0]}'.encode('ascii'))
+        else:
+            with open_binary(path) as fh:
+                digest = hashlib.file_digest(fh, 'blake2b')
+        digest.update(FORMAT_VERSION)
+
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def load(self, key: str) -> Workflow | None:
+        """Returns the Workflow stored by the key or None if there is no valid snapshot."""
+
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as fh:
+                blocks, links, ports = pickle.load(fh)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logger.warning(f'Snapshot {path} is broken: {ex}')
+            return None
+
+        logger.debug(f'Workflow has been loaded from the snapshot {path}.')
+        return Workflow(blocks, links, ports)
+
+    def store(self, key: str, workflow: Workflow):
+        """Stores the Workflow by the key and evicts old snapshots if the cache is too big."""
+
+        import tempfile
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first, so a concurrent reader never sees half of a snapshot.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fh:
+                    pickle.dump((workflow.blocks, workflow.links, workflow.ports), fh, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self._get_path(key))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as ex:
+            logger.warning(f'Snapshot has not been stored: {ex}')
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used snapshots until the cache fits max_size."""
+
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshots.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in snapshots)
+        for _, size, path in sorted(snapshots):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            logger.debug(f'Snapshot {path} has been evicted.')
+
+
+def create_snapshots(use_cache: bool, cache_limit: int) -> SnapshotCache | None:
+    """Returns the snapshot cache limited to cache_limit MiB (the --cache-limit option), or None without caching."""
+
+    return SnapshotCache(max_size=cache_limit * 1024 * 1024) if use_cache else None
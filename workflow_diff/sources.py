@@ -0,0 +1,370 @@
+import errno
+import functools
+import io
+import mmap
+import os
+import posixpath
+import re
+import threading
+import logging
+from collections import namedtuple
+
+from errors import WorkflowError
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import subprocess
+    from typing import IO
+
+logger = logging.getLogger(f'log.{__name__}')
+
+ZIP_MAGIC = b'PK\x03\x04'
+WORKFLOW_NAME = 'workflow.json'
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveMember(namedtuple('ArchiveMember', ('archive', 'name'))):
+    """A file or a directory in a zip archive, like workflow.json of a packaged .p7wf project."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        return f'{self.archive}:{self.name}'
+
+
+class GitObject(namedtuple('GitObject', ('repository', 'revision', 'path'))):
+    """A file or a directory of a revision in a local git repository, like HEAD~1:project/.p7/workflow.json."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        return f'{self.revision}:{self.path}'
+
+    @property
+    def spec(self) -> str:
+        return f'{self.revision}:{self.path}'
+
+
+# Where workflow.json and manifests are read from: a path on disk, a member of an archive or a git object.
+Location = str | ArchiveMember | GitObject
+
+
+class _MappedFile(mmap.mmap):
+    """A memory map which zipfile accepts as a file. mmap has seekable() only since Python 3.13."""
+
+    def seekable(self) -> bool:
+        return True
+
+
+class _Archive:
+    """A zip archive read through a memory map, so members are read without copying the file into the process."""
+
+    def __init__(self, path: str):
+        import zipfile
+
+        with open(path, 'rb') as fh:
+            self.stat = os.stat(fh.fileno())
+            self._map = _MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(self._map)
+        self.path = path
+        self.names = set(self._zip.namelist())
+
+    def open(self, name: str) -> 'IO[bytes]':
+        if name not in self.names:
+            raise FileNotFoundError(errno.ENOENT, 'There is no such member in the archive', f'{self.path}:{name}')
+
+        return self._zip.open(name)
+
+    def get_size(self, name: str) -> int:
+        if name not in self.names:
+            raise FileNotFoundError(errno.ENOENT, 'There is no such member in the archive', f'{self.path}:{name}')
+
+        return self._zip.getinfo(name).file_size
+
+    def is_directory(self, name: str) -> bool:
+        prefix = f'{name}/'
+        return any(member.startswith(prefix) for member in self.names)
+
+    def find_workflow(self) -> str | None:
+        """Returns the shallowest workflow.json, the one in a .p7 directory first."""
+
+        candidates = [name for name in self.names if posixpath.basename(name) == WORKFLOW_NAME]
+        if not candidates:
+            return None
+
+        return min(candidates, key=lambda name: (posixpath.basename(posixpath.dirname(name)) != '.p7',
+                                                 name.count('/'), name))
+
+
+class _GitReader:
+    """git cat-file processes of the repository. Objects are read one at a time, without a checkout.
+
+    --batch-check tells the id, the type and the size of an object, so only the parser reads the content by --batch.
+    """
+
+    def __init__(self, repository: str):
+        import atexit
+
+        self.repository = repository
+        self._processes = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def info(self, spec: str) -> tuple[str, str, int]:
+        """Returns the object id, the type and the size of the object named like rev:path."""
+
+        with self._lock:
+            _, oid, object_type, size = self._request('--batch-check', spec)
+
+        return oid, object_type, size
+
+    def read(self, spec: str) -> tuple[str, str, bytes]:
+        """Returns the object id, the type and the content of the object named like rev:path."""
+
+        with self._lock:
+            process, oid, object_type, size = self._request('--batch', spec)
+            content = process.stdout.read(size)
+            process.stdout.read(1)
+
+        return oid, object_type, content
+
+    def _request(self, option: str, spec: str) -> tuple['subprocess.Popen', str, str, int]:
+        """Asks the process of the option about the object and returns the process and the header of the answer."""
+
+        process = self._processes.get(option)
+        if process is None:
+            import subprocess
+
+            try:
+                process = subprocess.Popen(['git', 'cat-file', option], cwd=self.repository,
+                                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            except OSError as ex:
+                # A missing git executable must not look like a missing object.
+                raise OSError(f'git cannot be run in {self.repository}: {ex}') from ex
+            self._processes[option] = process
+
+        process.stdin.write(spec.encode('utf-8') + b'\n')
+        process.stdin.flush()
+        header = process.stdout.readline()
+        if not header:
+            raise OSError(f'git cat-file has failed in {self.repository}')
+        if header.endswith((b' missing\n', b' ambiguous\n')):
+            raise FileNotFoundError(errno.ENOENT, 'There is no such object in the repository', spec)
+
+        oid, object_type, size = header.decode('ascii').split()
+        return process, oid, object_type, int(size)
+
+    def close(self):
+        for process in self._processes.values():
+            if process.poll() is None:
+                process.stdin.close()
+                process.wait()
+
+
+_archives = {}
+_git_readers = {}
+_lock = threading.Lock()
+
+
+def _get_archive(path: str) -> _Archive:
+    """Returns the opened archive. It is opened again if the file has been changed."""
+
+    with _lock:
+        archive = _archives.get(path)
+        if archive is not None:
+            stat = os.stat(path)
+            if (stat.st_mtime_ns, stat.st_size) != (archive.stat.st_mtime_ns, archive.stat.st_size):
+                archive = None
+        if archive is None:
+            archive = _archives[path] = _Archive(path)
+
+    return archive
+
+
+def _get_git_reader(repository: str) -> _GitReader:
+    with _lock:
+        reader = _git_readers.get(repository)
+        if reader is None:
+            reader = _git_readers[repository] = _GitReader(repository)
+
+    return reader
+
+
+def forget_handles():
+    """Forgets the archives and the git processes opened before a fork, so a forked process opens its own ones.
+
+    Otherwise processes would read and write the same git cat-file pipe at once.
+    """
+
+    global _lock
+
+    _archives.clear()
+    _git_readers.clear()
+    _lock = threading.Lock()
+
+
+@functools.cache
+def _is_work_tree(directory: str) -> bool:
+    """Returns True if the directory is inside a git work tree."""
+
+    import subprocess
+
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--is-inside-work-tree'], cwd=directory,
+                                capture_output=True, text=True)
+    except OSError:
+        return False
+
+    return result.returncode == 0 and result.stdout.strip() == 'true'
+
+
+def is_git_spec(path: str) -> bool:
+    """Returns True if the path is not a file but a git object like rev:path of the current repository.
+
+    Outside a git work tree such a path is just a missing file.
+    """
+
+    return (':' in path and not os.path.exists(path) and re.match(r'[A-Za-z]:[\\/]', path) is None
+            and _is_work_tree(os.getcwd()))
+
+
+def is_archive(path: str) -> bool:
+    """Returns True if the path is a zip archive, like a packaged .p7wf project."""
+
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+    except OSError:
+        return False
+
+
+def get_input_path(path: str) -> str:
+    """Returns the absolute path, or the git object itself because it is relative to the repository."""
+
+    return path if is_git_spec(path) else os.path.abspath(path)
+
+
+def get_git_object(spec: str) -> GitObject:
+    """Returns the git object of the current repository named like rev:path."""
+
+    revision, path = spec.split(':', 1)
+    return GitObject(os.getcwd(), revision, path)
+
+
+def get_git_type(location: GitObject) -> str | None:
+    """Returns 'blob' or 'tree', or None if there is no such object."""
+
+    try:
+        return _get_git_reader(location.repository).info(location.spec)[1]
+    except FileNotFoundError:
+        return None
+    except OSError as ex:
+        raise WorkflowError(str(ex)) from ex
+
+
+def find_archive_workflow(path: str) -> ArchiveMember:
+    """Returns workflow.json of the packaged project."""
+
+    try:
+        archive = _get_archive(path)
+    except Exception as ex:
+        raise WorkflowError(f'Archive {path} cannot be opened: {ex}') from ex
+
+    name = archive.find_workflow()
+    if name is None:
+        raise WorkflowError(f'There is no {WORKFLOW_NAME} in the archive {path}.')
+
+    return ArchiveMember(path, name)
+
+
+def join_location(location: Location, *names: str) -> Location:
+    if isinstance(location, ArchiveMember):
+        return location._replace(name=posixpath.join(location.name, *names))
+    if isinstance(location, GitObject):
+        return location._replace(path=posixpath.join(location.path, *names))
+
+    return os.path.join(location, *names)
+
+
+def get_parent(location: Location) -> Location:
+    if isinstance(location, ArchiveMember):
+        return location._replace(name=posixpath.dirname(location.name))
+    if isinstance(location, GitObject):
+        return location._replace(path=posixpath.dirname(location.path))
+
+    return os.path.dirname(location)
+
+
+def is_directory(location: Location) -> bool:
+    if isinstance(location, ArchiveMember):
+        return _get_archive(location.archive).is_directory(location.name)
+    if isinstance(location, GitObject):
+        return get_git_type(location) == 'tree'
+
+    return os.path.isdir(location)
+
+
+def open_binary(location: Location) -> 'IO[bytes]':
+    """Opens the file for reading. Only this member of an archive or this git object is read."""
+
+    if isinstance(location, ArchiveMember):
+        return _get_archive(location.archive).open(location.name)
+    if isinstance(location, GitObject):
+        return io.BytesIO(_get_git_reader(location.repository).read(location.spec)[2])
+
+    return open(location, 'rb')
+
+
+def open_text(location: Location) -> 'IO[str]':
+    if isinstance(location, str):
+        return open(location, 'r', encoding='utf-8')
+
+    return io.TextIOWrapper(open_binary(location), encoding='utf-8')
+
+
+def get_stamp(location: Location) -> tuple[object, int]:
+    """Returns a stamp which changes with the content of the file, and its size."""
+
+    if isinstance(location, ArchiveMember):
+        archive = _get_archive(location.archive)
+        return (archive.stat.st_mtime_ns, archive.stat.st_size), archive.get_size(location.name)
+    if isinstance(location, GitObject):
+        oid, _, size = _get_git_reader(location.repository).info(location.spec)
+        return oid, size
+
+    stat = os.stat(location)
+    return (stat.st_mtime_ns, stat.st_size), stat.st_size
+
+
+def _have_same_content(first: 'IO[bytes]', second: 'IO[bytes]') -> bool:
+    """Compares the files chunk by chunk, so different files are rarely read to the end."""
+
+    while True:
+        chunk = first.read(CHUNK_SIZE)
+        if chunk != second.read(CHUNK_SIZE):
+            return False
+        if not chunk:
+            return True
+
+
+def files_are_identical(first_path: Location, second_path: Location) -> bool:
+    """Returns True if both files have the same content. Missing files are never identical.
+
+    Git objects are compared by their ids, which are hashes of the content already.
+    """
+
+    try:
+        (first_stamp, first_size), (second_stamp, second_size) = get_stamp(first_path), get_stamp(second_path)
+        if first_size != second_size:
+            return False
+
+        if isinstance(first_path, GitObject) and isinstance(second_path, GitObject):
+            identical = first_stamp == second_stamp
+        else:
+            with open_binary(first_path) as first, open_binary(second_path) as second:
+                identical = _have_same_content(first, second)
+    except OSError:
+        return False
+
+    logger.debug(f'Files are identical: {identical}')
+    return identical
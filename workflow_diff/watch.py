@@ -0,0 +1,407 @@
+import bisect
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import select
+import struct
+import sys
+import time
+import logging
+
+from blocks import Block, create_block
+from context import Context
+from diffs import RENDERERS
+from index import WorkflowIndex
+from link import Link, LinkTable
+from loader import load_workflow, paused_gc
+from main import diff_workflows
+from port import PortTable
+from registry import get_comparers
+from snapshot import create_snapshots
+from workflow import Workflow, create_link
+
+logger = logging.getLogger(f'log.{__name__}')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+EVENT_HEADER = struct.Struct('iIII')
+
+# Editors often save with several writes and renames, one report is enough for them.
+SETTLE_SECONDS = 0.02
+POLL_SECONDS = 0.2
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class _ParseError(ValueError):
+    pass
+
+
+def _skip(text: str, pos: int) -> int:
+    return _whitespace.match(text, pos).end()
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    """Returns the position after the char which must be the next one after whitespaces."""
+
+    pos = _skip(text, pos)
+    if text[pos:pos + 1] != char:
+        raise _ParseError(f'"{char}" is expected at {pos}')
+
+    return _skip(text, pos + 1)
+
+
+class IncrementalParser:
+    """Parses versions of one workflow.json, reusing the Blocks and the Links whose text has not been changed.
+
+    The text of a new version is compared with the previous one from both ends. Items of the blocks and the links
+    arrays which lie in the common prefix or suffix are kept, only the items between them are decoded again,
+    and the index and the link lookups are updated only with the changed items.
+
+    Items of both arrays are kept in the file order as parallel lists of their arrays, their spans in the text
+    and their Blocks or Links. Spans of the arrays themselves are kept from the first item to the closing bracket.
+    """
+
+    def __init__(self):
+        self.text = None
+        self.workflow = None
+        self._keys = []
+        self._starts = []
+        self._ends = []
+        self._values = []
+        self._arrays = {}
+        self._decoder = json.JSONDecoder()
+
+    def parse(self, text: str) -> tuple[Workflow, int]:
+        """Returns the Workflow of the text and the number of items which have been decoded."""
+
+        update = self._update(text) if self.workflow is not None else None
+        if update is None:
+            workflow = self._parse_all(text)
+            count = len(self._values)
+        else:
+            workflow, count = update
+
+        self.text = text
+        self.workflow = workflow
+
+        return workflow, count
+
+    def reset(self):
+        """Forgets the previous version, so the next one is parsed in full."""
+
+        self.text = None
+        self.workflow = None
+
+    def _create(self, text: str, key: str, pos: int, ports: PortTable) -> tuple[Block | Link, int]:
+        value, end = self._decoder.raw_decode(text, pos)
+        if not isinstance(value, dict):
+            raise _ParseError(f'An item of {key} is expected at {pos}')
+
+        return create_block(value, ports) if key == 'blocks' else create_link(value), end
+
+    def _parse_all(self, text: str) -> Workflow:
+        """Parses the whole text like JsonArrayStream walks workflow.json."""
+
+        keys, starts, ends, values = [], [], [], []
+        arrays = {}
+        found = set()
+        ports = PortTable()
+
+        pos = _expect(text, 0, '{')
+        while text[pos:pos + 1] != '}':
+            key, pos = self._decoder.raw_decode(text, pos)
+            pos = _expect(text, pos, ':')
+
+            if key in ('blocks', 'links') and text[pos:pos + 1] == '[':
+                opening = pos + 1
+                pos = _skip(text, pos + 1)
+                while text[pos:pos + 1] != ']':
+                    value, end = self._create(text, key, pos, ports)
+                    keys.append(key)
+                    starts.append(pos)
+                    ends.append(end)
+                    values.append(value)
+                    pos = _skip(text, end)
+                    if text[pos:pos + 1] != ']':
+                        pos = _expect(text, pos, ',')
+                        if text[pos:pos + 1] == ']':
+                            raise _ParseError(f'An item is expected at {pos}')
+                # A repeated array is not updated item by item.
+                arrays[key] = [opening, pos] if key not in found else None
+                pos += 1
+            else:
+                _, pos = self._decoder.raw_decode(text, pos)
+            found.add(key)
+
+            pos = _skip(text, pos)
+            if text[pos:pos + 1] != '}':
+                pos = _expect(text, pos, ',')
+                if text[pos:pos + 1] == '}':
+                    raise _ParseError(f'A key is expected at {pos}')
+
+        if 'blocks' not in found:
+            raise _ParseError('There is no blocks array')
+
+        self._keys, self._starts, self._ends, self._values = keys, starts, ends, values
+        self._arrays = arrays
+
+        return Workflow([value for key, value in zip(keys, values) if key == 'blocks'],
+                        LinkTable(value for key, value in zip(keys, values) if key == 'links'), ports)
+
+    def _update(self, text: str) -> tuple[Workflow, int] | None:
+        """Decodes only the items between the common prefix and suffix of the texts.
+
+        Returns None if the changed text is not inside one array, like an edit of other keys or of the brackets.
+        """
+
+        old_text = self.text
+        prefix = _common_prefix(old_text, text)
+        suffix = _common_suffix(old_text, text, min(len(old_text), len(text)) - prefix)
+        if prefix == len(old_text) == len(text):
+            return self.workflow, 0
+
+        changed_end = len(old_text) - suffix
+        key = next((key for key, span in self._arrays.items()
+                    if span is not None and span[0] <= prefix and changed_end <= span[1]), None)
+        if key is None:
+            return None
+
+        opening, closing = self._arrays[key]
+        first = bisect.bisect_right(self._ends, prefix)
+        last = bisect.bisect_left(self._starts, changed_end, first)
+        after_item = first > 0 and self._keys[first - 1] == key
+        before_item = last < len(self._keys) and self._keys[last] == key
+
+        shift = len(text) - len(old_text)
+        pos = self._ends[first - 1] if after_item else opening
+        stop = (self._starts[last] if before_item else closing) + shift
+        ports = PortTable()
+        starts, ends, added = [], [], []
+
+        # The changed text is a run of items and commas between the kept items or the brackets.
+        token = 'item' if after_item else '['
+        try:
+            while (pos := _skip(text, pos)) < stop:
+                if token == 'item':
+                    if text[pos] != ',':
+                        return None
+                    pos += 1
+                    token = ','
+                else:
+                    value, end = self._create(text, key, pos, ports)
+                    starts.append(pos)
+                    ends.append(end)
+                    added.append(value)
+                    pos = end
+                    token = 'item'
+        except ValueError:
+            return None
+        # A kept item follows a comma or the opening bracket, the closing bracket follows an item or the opening one.
+        if pos != stop or token == ('item' if before_item else ','):
+            return None
+
+        deleted = self._values[first:last]
+        tail = first + len(added)
+        self._keys[first:last] = [key] * len(added)
+        self._values[first:last] = added
+        self._starts[first:last] = starts
+        self._ends[first:last] = ends
+        if shift:
+            self._starts[tail:] = [start + shift for start in self._starts[tail:]]
+            self._ends[tail:] = [end + shift for end in self._ends[tail:]]
+            self._arrays[key][1] += shift
+            for span in self._arrays.values():
+                if span is not None and span[0] > closing:
+                    span[0] += shift
+                    span[1] += shift
+
+        previous = self.workflow
+        if key == 'blocks':
+            blocks = [value for item_key, value in zip(self._keys, self._values) if item_key == 'blocks']
+            workflow = Workflow(blocks, previous.links, ports)
+            index = WorkflowIndex.from_previous(previous.index, blocks, deleted, added)
+        else:
+            links = [value for item_key, value in zip(self._keys, self._values) if item_key == 'links']
+            workflow = Workflow(previous.blocks, previous.links.updated(links, deleted, added), ports)
+            index = previous.index
+        # Ports of the kept Blocks stay in the tables of the versions they have been created in.
+        vars(workflow)['index'] = index
+
+        return workflow, len(added)
+
+
+def _common_prefix(first: str, second: str) -> int:
+    """Returns the length of the common prefix. Slices are compared by halves, so the loop runs only log n times."""
+
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+def _common_suffix(first: str, second: str, limit: int) -> int:
+    """Returns the length of the common suffix, at most limit."""
+
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[len(first) - middle:len(first) - low] == second[len(second) - middle:len(second) - low]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+class InotifyWatcher:
+    """Waits for a file to be written or replaced, by inotify events of its directory."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.name = os.fsencode(os.path.basename(path))
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify cannot be initialized')
+
+        # Editors which save through a temporary file replace the file, so its directory is watched.
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(os.path.dirname(path)), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, 'Directory cannot be watched', os.path.dirname(path))
+
+    def wait(self):
+        while not self._read_events(None):
+            pass
+        # Let the rest of the save happen.
+        while self._read_events(SETTLE_SECONDS):
+            pass
+
+    def _read_events(self, timeout: float | None) -> bool:
+        """Returns True if the file has been changed before the timeout."""
+
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return False
+
+        data = os.read(self._fd, 64 * 1024)
+        found = False
+        pos = 0
+        while pos < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            found = found or data[pos:pos + length].rstrip(b'\0') == self.name
+            pos += length
+
+        return found
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Waits for a file to change by polling its mtime and size, where inotify is not available."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp = self._get_stamp()
+
+    def _get_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def wait(self):
+        while True:
+            time.sleep(POLL_SECONDS)
+            stamp = self._get_stamp()
+            if stamp != self._stamp and stamp is not None:
+                self._stamp = stamp
+                return
+
+    def close(self):
+        pass
+
+
+def get_watcher(path: str) -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError, TypeError) as ex:
+            logger.warning(f'inotify is not available, the file is polled: {ex}')
+
+    return PollingWatcher(path)
+
+
+def _read_text(path: str) -> str | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return fh.read()
+    except (FileNotFoundError, UnicodeDecodeError) as ex:
+        logger.error(ex)
+        return None
+
+
+def watch(context: Context):
+    """Prints the report every time the second workflow.json is saved.
+
+    The first Workflow is loaded once and kept with its index and hashes. A new version of the second one reuses
+    the Blocks and the hashes of the previous version for the text which has not been changed, and the Merkle
+    matching compares again only the Blocks whose hashes differ from the first Workflow.
+    """
+
+    path = context.second_path_to_workflow
+    if not isinstance(path, str):
+        logger.error('--watch needs a workflow on disk, not in an archive or a git revision.')
+        exit(-1)
+
+    context.load_protoblocks()
+    snapshots = create_snapshots(context.use_cache, context.cache_limit)
+    with paused_gc():
+        old_workflow = load_workflow(context.first_path_to_workflow, context.streaming, snapshots)
+    comparers = get_comparers(context.only, context.skip)
+
+    parser = IncrementalParser()
+    watcher = get_watcher(path)
+    try:
+        while True:
+            start = time.perf_counter()
+            text = _read_text(path)
+            if text is not None and text != parser.text:
+                _report(context, parser, text, old_workflow, comparers, start)
+            watcher.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def _report(context: Context, parser: IncrementalParser, text: str, old_workflow: Workflow, comparers: list,
+            start: float):
+    """Parses the new version of the text and prints its report."""
+
+    try:
+        with paused_gc():
+            new_workflow, count = parser.parse(text)
+    except (ValueError, KeyError, TypeError) as ex:
+        # The file may be saved half-written or broken, the next save is waited for.
+        logger.error(f'{context.second_path_to_workflow} cannot be parsed: {ex}')
+        parser.reset()
+        return
+
+    renderer = RENDERERS[context.output_format]()
+    diff_workflows(old_workflow, new_workflow, renderer, comparers, similarity=context.similarity,
+                   impact=context.impact)
+    sys.stdout.flush()
+    print(f'--- {time.strftime("%H:%M:%S")}: {count} items have been parsed, the report has taken '
+          f'{(time.perf_counter() - start) * 1000:.0f} ms', file=sys.stderr, flush=True)
@@ -1,49 +1,169 @@
 import logging
 import json
+import sys
+from functools import cached_property
+from typing import Container, Iterator
 
 from blocks import Block, create_block
-from link import Link
+from errors import WorkflowError
+from link import Link, LinkTable
+from port import PortTable
+from index import WorkflowIndex
+from json_stream import JsonArrayStream
+from scope import get_skeleton, select_scope
+from sources import Location, open_text
 
 logger = logging.getLogger(f'log.{__name__}')
 
 
-def open_file(file_path: str) -> dict:
+def open_file(file_path: Location) -> dict:
     """Open json file and return a dictionary."""
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with open_text(file_path) as f:
             dict_ = json.load(f)
     except FileNotFoundError as ex:
-        logger.error(ex)
-        exit(-1)
+        raise WorkflowError(str(ex)) from ex
 
     return dict_
 
 
-def get_blocks(workflow: dict) -> list[Block]:
-    """Returns a list of the Blocks from the workflow.json"""
+def check_keys(keys: Container[str]):
+    """Raises WorkflowError unless the top level keys of workflow.json have the blocks array."""
 
-    return [create_block(block) for block in workflow['blocks']]
+    if 'blocks' not in keys:
+        raise WorkflowError('Specified json file has wrong format.')
 
 
-def get_links(workflow: dict) -> list[Link]:
+def stream_file(file_path: Location) -> tuple[list[Block], LinkTable, PortTable]:
+    """Walks the blocks and links arrays of json file item by item and returns the Blocks and Links."""
+
+    blocks = []
+    links = LinkTable()
+    ports = PortTable()
+
+    try:
+        with open_text(file_path) as f:
+            stream = JsonArrayStream(f)
+            for key, item in stream.items({'blocks', 'links'}):
+                if key == 'blocks':
+                    blocks.append(create_block(item, ports))
+                else:
+                    links.add(create_link(item))
+    except FileNotFoundError as ex:
+        raise WorkflowError(str(ex)) from ex
+
+    check_keys(stream.keys)
+
+    return blocks, links, ports
+
+
+def stream_scoped_file(file_path: Location, scope: str) -> tuple[list[Block], list[Block], LinkTable, PortTable]:
+    """Walks json file twice and returns the scoped Blocks, the context Blocks, the Links and the Ports.
+
+    The first pass reads only skeletons of the Blocks and the Links to find the scope,
+    the second one creates the Blocks.
+    """
+
+    skeletons = []
+    links = []
+
+    try:
+        with open_text(file_path) as f:
+            stream = JsonArrayStream(f)
+            for key, item in stream.items({'blocks', 'links'}):
+                if key == 'blocks':
+                    skeletons.append(get_skeleton(item))
+                else:
+                    links.append(create_link(item))
+    except FileNotFoundError as ex:
+        raise WorkflowError(str(ex)) from ex
+
+    check_keys(stream.keys)
+
+    scoped, context, links = select_scope(skeletons, links, scope)
+    del skeletons
+
+    blocks = []
+    context_blocks = []
+    ports = PortTable()
+    with open_text(file_path) as f:
+        for _, item in JsonArrayStream(f).items({'blocks'}):
+            if item['guid'] in scoped:
+                blocks.append(create_block(item, ports))
+            elif item['guid'] in context:
+                context_blocks.append(create_block(item, ports))
+
+    return blocks, context_blocks, LinkTable(links), ports
+
+
+def create_link(link: dict) -> Link:
+    """Creating an object of Link from the dictionary. Guids are interned to be shared with Ports."""
+
+    return Link(guid=sys.intern(link['guid']), src=sys.intern(link['src']['port']), dst=sys.intern(link['dst']['port']))
+
+
+def get_blocks(workflow: dict, port_table: PortTable) -> list[Block]:
+    """Returns a list of the Blocks from the workflow.json. Their Ports are stored in the port_table."""
+
+    return [create_block(block, port_table) for block in workflow['blocks']]
+
+
+def get_links(workflow: dict) -> Iterator[Link]:
     """Returns a list of the Links from the workflow.json"""
 
     for link in workflow['links']:
-        yield Link(guid=link['guid'], src=link['src']['port'], dst=link['dst']['port'])
+        yield create_link(link)
 
 
 class Workflow:
     blocks: list[Block]
-    links: list[Link]
+    links: LinkTable
+    ports: PortTable
+    context_blocks: list[Block]
+
+    def __init__(self, blocks: list[Block], links: LinkTable, ports: PortTable | None = None,
+                 context_blocks: list[Block] | None = None):
+        self.blocks = blocks
+        self.links = links
+        self.ports = ports if ports is not None else PortTable()
+        # Blocks out of the scope which are needed only to print paths, they are never compared.
+        self.context_blocks = context_blocks if context_blocks is not None else []
+
+    @classmethod
+    def from_dict(cls, workflow_dict: dict, scope: str | None = None):
+        """Creating an object of Workflow from the dictionary. With a scope only the scoped Blocks are created."""
+
+        check_keys(workflow_dict)
+
+        ports = PortTable()
+        if scope is None:
+            return cls(get_blocks(workflow_dict, ports), LinkTable(get_links(workflow_dict)), ports)
+
+        scoped, context, links = select_scope([get_skeleton(block) for block in workflow_dict['blocks']],
+                                              get_links(workflow_dict), scope)
+        blocks = [create_block(block, ports) for block in workflow_dict['blocks'] if block['guid'] in scoped]
+        context_blocks = [create_block(block, ports) for block in workflow_dict['blocks'] if block['guid'] in context]
+
+        return cls(blocks, LinkTable(links), ports, context_blocks)
+
+    @classmethod
+    def from_file(cls, path_to_workflow: Location, streaming: bool = False, scope: str | None = None):
+        """Creating an object of Workflow from the workflow.json. The streaming mode never keeps the whole document.
+
+        With a scope only the Block with its descendants and the Links touching them are loaded.
+        """
+
+        if streaming and scope is not None:
+            blocks, context_blocks, links, ports = stream_scoped_file(path_to_workflow, scope)
+            return cls(blocks, links, ports, context_blocks)
+        if streaming:
+            return cls(*stream_file(path_to_workflow))
 
-    def __init__(self, path_to_workflow: str):
-        """Creating an object of Workflow from the dictionary."""
+        return cls.from_dict(open_file(file_path=path_to_workflow), scope)
 
-        workflow_dict = open_file(file_path=path_to_workflow)
-        if 'blocks' not in workflow_dict:
-            logger.error('Specified json file has wrong format.')
-            exit(-1)
+    @cached_property
+    def index(self) -> WorkflowIndex:
+        """Guid index of the Blocks and Ports, built on first use."""
 
-        self.blocks = get_blocks(workflow_dict)
-        self.links = get_links(workflow_dict)
+        return WorkflowIndex(self.blocks, self.context_blocks)